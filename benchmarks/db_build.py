@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+# author: Tiancheng Zhao
+"""
+Benchmark the build time and peak memory of Database at several sizes. Every size is built in a fresh process
+so that the peak RSS of one build does not hide the next one.
+
+    python benchmarks/db_build.py --sizes 10000 1000000 10000000
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from simdial.database import Database
+
+
+def _build(args):
+    num_rows, usr_modalities, sys_modalities, seed = args
+    np.random.seed(seed)
+    base_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.time()
+    db = Database([np.ones(m) for m in usr_modalities], [np.ones(m) for m in sys_modalities], num_rows)
+    build_time = time.time() - start
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in KB on Linux
+    return {'num_rows': num_rows,
+            'build_sec': build_time,
+            'peak_rss_mb': (peak_rss - base_rss) / 1024.0,
+            'table_mb': (db.table.nbytes + db.sys_table.nbytes) / 2.0**20,
+            'index_mb': sum(index.nbytes for index in db.indexes) / 2.0**20,
+            'unique_rows': len(db.unique_rows)}
+
+
+def run(sizes, usr_modalities, sys_modalities, seed=0):
+    results = []
+    for num_rows in sizes:
+        pool = multiprocessing.Pool(1)
+        try:
+            results.append(pool.apply(_build, ((num_rows, usr_modalities, sys_modalities, seed),)))
+        finally:
+            pool.close()
+            pool.join()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10**4, 10**6, 10**7])
+    parser.add_argument('--usr-modalities', type=int, nargs='+', default=[10, 12])
+    parser.add_argument('--sys-modalities', type=int, nargs='+', default=[5, 5, 2, 2, 2, 2, 2])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None, help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.usr_modalities, args.sys_modalities, args.seed)
+    for r in results:
+        print("{num_rows:>10d} rows  build {build_sec:8.3f}s  peak +{peak_rss_mb:8.1f}MB  "
+              "table {table_mb:7.1f}MB  index {index_mb:7.1f}MB".format(**r))
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
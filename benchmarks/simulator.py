@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+# author: Tiancheng Zhao
+"""
+Benchmark the hot paths of the simulator with fixed seeds, so that two runs on the same machine do the same work:
+
+    db          Database.select and sample_unique_row at several db sizes
+    stage       System.step, User.step, both channels and both NLGs, timed inside MixSpec sessions by
+                simdial.profiler.Profiler
+    gen         end-to-end Generator.gen of every shipped complexity spec
+
+Every timing is the best of --repeat runs. Run the suite and compare two result files with
+
+    python benchmarks/simulator.py run --output before.json
+    python benchmarks/simulator.py run --output after.json
+    python benchmarks/simulator.py compare before.json after.json --threshold 0.1
+
+compare exits with 1 if any benchmark is slower than the baseline by more than the threshold.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+from timeit import default_timer
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from simdial import complexity
+from simdial.complexity import Complexity
+from simdial.database import Database
+from simdial.domain import Domain
+from simdial.generator import Generator
+from simdial.profiler import Profiler
+from simdial.rng import RandomPool
+from multiple_domains import RestSpec
+
+SPECS = [complexity.CleanSpec, complexity.PropSpec, complexity.EnvSpec, complexity.InteractSpec,
+         complexity.MixSpec]
+
+# the stages of Generator._gen_session that time one component call each
+STAGES = ['system', 'user', 'action_channel', 'word_channel', 'sys_nlg', 'usr_nlg']
+
+
+def _best_of(repeat, func):
+    """
+    :param func: a function that does one run and returns its wall time
+    :return: the shortest of repeat runs
+    """
+    return min(func() for _ in range(repeat))
+
+
+def _record(results, name, value, unit, work=None):
+    """
+    :param work: a number that only depends on the seed, e.g. the number of turns. compare warns if it
+    changed, since the timings then measure different work.
+    """
+    results[name] = {'value': value, 'unit': unit}
+    if work is not None:
+        results[name]['work'] = work
+
+
+def bench_db(results, db_sizes, num_calls, repeat, seed):
+    usr_modalities = [len(values) for _, _, values in RestSpec.usr_slots]
+    sys_modalities = [len(values) for _, _, values in RestSpec.sys_slots]
+    for num_rows in db_sizes:
+        np.random.seed(seed)
+        db = Database([np.ones(m) for m in usr_modalities], [np.ones(m) for m in sys_modalities], num_rows)
+
+        # queries of existing rows with each attribute dropped half of the time
+        state = np.random.RandomState(seed)
+        rows = db.table[state.randint(0, num_rows, num_calls)]
+        mask = state.rand(*rows.shape) < 0.5
+        queries = [[int(v) if keep else None for v, keep in zip(row, row_mask)] for row, row_mask in zip(rows, mask)]
+
+        def run_select():
+            start = default_timer()
+            for query in queries:
+                db.select(query)
+            return default_timer() - start
+
+        def run_sample():
+            rng = RandomPool(seed)
+            start = default_timer()
+            for _ in range(num_calls):
+                db.sample_unique_row(rng=rng)
+            return default_timer() - start
+
+        work = sum(len(db.select(query)) for query in queries)
+        _record(results, "db.select[db_size=%d]" % num_rows, 1e6 * _best_of(repeat, run_select) / num_calls,
+                'usec/call', work)
+        _record(results, "db.sample_unique_row[db_size=%d]" % num_rows,
+                1e6 * _best_of(repeat, run_sample) / num_calls, 'usec/call')
+
+
+def bench_stages(results, num_sess, repeat, seed):
+    np.random.seed(seed)
+    domain = Domain(RestSpec())
+    complex = Complexity(complexity.MixSpec)
+    best = {}
+    for _ in range(repeat):
+        np.random.seed(seed)
+        profiler = Profiler()
+        Generator(profiler=profiler).gen(domain, complex, num_sess=num_sess)
+        for stage in STAGES:
+            calls, sec = profiler.stages[stage]
+            usec = 1e6 * sec / calls
+            best[stage] = (calls, min(usec, best.get(stage, (0, usec))[1]))
+    for stage in STAGES:
+        calls, usec = best[stage]
+        _record(results, "stage.%s[MixSpec]" % stage, usec, 'usec/call', calls)
+
+
+def bench_gen(results, num_sess, repeat, seed):
+    np.random.seed(seed)
+    domain = Domain(RestSpec())
+    for spec in SPECS:
+        complex = Complexity(spec)
+        turns = []
+
+        def run_gen():
+            np.random.seed(seed)
+            start = default_timer()
+            dialogs, _ = Generator().gen(domain, complex, num_sess=num_sess)
+            elapsed = default_timer() - start
+            turns.append(sum(len(d) for d in dialogs))
+            return elapsed
+
+        _record(results, "gen[%s]" % spec.__name__, 1e3 * _best_of(repeat, run_gen) / num_sess, 'msec/dialog',
+                turns[0])
+
+
+def run(suites, db_sizes, num_calls, num_sess, repeat, seed):
+    """
+    :return: a JSON-serializable dict of the settings and the results of the benchmarks
+    """
+    results = {}
+    if 'db' in suites:
+        bench_db(results, db_sizes, num_calls, repeat, seed)
+    if 'stage' in suites:
+        bench_stages(results, num_sess, repeat, seed)
+    if 'gen' in suites:
+        bench_gen(results, num_sess, repeat, seed)
+    return {'meta': {'python': platform.python_version(),
+                     'numpy': np.__version__,
+                     'machine': platform.machine(),
+                     'seed': seed,
+                     'repeat': repeat,
+                     'num_calls': num_calls,
+                     'num_sess': num_sess},
+            'results': results}
+
+
+def compare(base, new, threshold):
+    """
+    All benchmarks measure time per operation, so a larger value is slower.
+
+    :return: the rows of (name, base value, new value, ratio, flag) and the number of regressions
+    """
+    rows = []
+    num_regressions = 0
+    for name in sorted(set(base['results']) | set(new['results'])):
+        b, n = base['results'].get(name), new['results'].get(name)
+        if b is None or n is None:
+            rows.append((name, b and b['value'], n and n['value'], None, "missing"))
+            continue
+        ratio = n['value'] / b['value'] if b['value'] > 0 else float('inf')
+        if ratio > 1 + threshold:
+            flag = "REGRESSION"
+            num_regressions += 1
+        elif ratio < 1 - threshold:
+            flag = "faster"
+        else:
+            flag = ""
+        if b.get('work') != n.get('work'):
+            flag = (flag + " work changed").strip()
+        rows.append((name, b['value'], n['value'], ratio, flag))
+    return rows, num_regressions
+
+
+def _load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command')
+
+    run_parser = subparsers.add_parser('run', help="run the benchmarks")
+    run_parser.add_argument('--suites', nargs='+', choices=['db', 'stage', 'gen'], default=['db', 'stage', 'gen'])
+    run_parser.add_argument('--db-sizes', type=int, nargs='+', default=[100, 10**4, 10**6])
+    run_parser.add_argument('--num-calls', type=int, default=10000, help="the number of calls per db benchmark")
+    run_parser.add_argument('--num-sess', type=int, default=200, help="the number of dialogs per gen benchmark")
+    run_parser.add_argument('--repeat', type=int, default=3)
+    run_parser.add_argument('--seed', type=int, default=0)
+    run_parser.add_argument('--output', default=None, help="write the results as JSON to this file")
+
+    compare_parser = subparsers.add_parser('compare', help="compare two result files")
+    compare_parser.add_argument('base')
+    compare_parser.add_argument('new')
+    compare_parser.add_argument('--threshold', type=float, default=0.1,
+                                help="flag a regression if new is slower than base by more than this ratio")
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        report = run(args.suites, args.db_sizes, args.num_calls, args.num_sess, args.repeat, args.seed)
+        for name, r in sorted(report['results'].items()):
+            print("{:<45s} {:12.3f} {}".format(name, r['value'], r['unit']))
+        if args.output is not None:
+            with open(args.output, "w") as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+    else:
+        base, new = _load(args.base), _load(args.new)
+        if base['meta'] != new['meta']:
+            print("warning: the settings differ, %s vs %s" % (base['meta'], new['meta']))
+        rows, num_regressions = compare(base, new, args.threshold)
+        fmt = lambda v: "{:12.3f}".format(v) if v is not None else "{:>12s}".format("-")
+        for name, b, n, ratio, flag in rows:
+            print("{:<45s} {} {} {} {}".format(name, fmt(b), fmt(n), fmt(ratio), flag))
+        print("%d regression(s) over %.0f%%" % (num_regressions, 100 * args.threshold))
+        sys.exit(1 if num_regressions > 0 else 0)
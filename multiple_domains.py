@@ -2,6 +2,7 @@
 # author: Tiancheng Zhao
 from simdial.domain import Domain, DomainSpec
 from simdial.generator import Generator
+from simdial.tracing import configure_logging
 from simdial import complexity
 import string
 
@@ -60,6 +61,7 @@ class RestSpec(DomainSpec):
 
 
 if __name__ == "__main__":
+    configure_logging()
     test_size = 500
     train_size = 2000
     gen_bot = Generator()
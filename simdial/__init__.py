@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 # author: Tiancheng Zhao
 import logging
-from simdial.config import Config
+from simdial.tracing import configure_logging
 
-logging.basicConfig(filename='simdial.log' if Config.debug is False else None, level=logging.DEBUG,
-                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+# logging is opt-in, see configure_logging
+logging.getLogger(__name__).addHandler(logging.NullHandler())
@@ -2,7 +2,6 @@
 # author: Tiancheng Zhao
 
 import logging
-import copy
 
 
 class Agent(object):
@@ -26,24 +25,64 @@ class Agent(object):
 class Action(dict):
     """
     A generic class that corresponds to a discourse unit. An action is made of an Act and a list of parameters.
+    Actions are immutable, so they are shared by the agents, channels and histories without copies. Noise and
+    lexicalization create new actions via with_act, with_parameters, replace_parameter and add_parameter.
     
     :ivar act: dialog act String
-    :ivar parameters: [{slot -> usr_constrain}, {sys_slot -> value}] for INFORM, and [(type, value)...] for other acts. 
+    :ivar parameters: [{slot -> usr_constrain}, {sys_slot -> value}] for INFORM, and [(type, value)...] for other acts.
+    It is stored as a tuple.
     
     """
+    __slots__ = ('act', 'parameters')
 
     def __init__(self, act, parameters=None):
-        self.act = act
         if parameters is None:
-            self.parameters = []
+            parameters = ()
         elif type(parameters) is not list:
-            self.parameters = [parameters]
+            parameters = (parameters,)
         else:
-            self.parameters = parameters
-        super(Action, self).__init__(act=self.act, parameters=self.parameters)
+            parameters = tuple(parameters)
+        object.__setattr__(self, 'act', act)
+        object.__setattr__(self, 'parameters', parameters)
+        super(Action, self).__init__(act=act, parameters=parameters)
+
+    def _immutable(self, *args, **kwargs):
+        raise TypeError("Action is immutable")
+
+    __setattr__ = __delattr__ = __setitem__ = __delitem__ = _immutable
+    clear = pop = popitem = setdefault = update = _immutable
+
+    def __reduce__(self):
+        return Action, (self.act, list(self.parameters))
+
+    def __repr__(self):
+        return repr(dict(act=self.act, parameters=list(self.parameters)))
+
+    def with_act(self, act):
+        """
+        :return: a new action with the same parameters and the given act
+        """
+        return Action(act, list(self.parameters))
+
+    def with_parameters(self, parameters):
+        """
+        :return: a new action with the same act and the given parameters
+        """
+        return Action(self.act, parameters)
+
+    def replace_parameter(self, index, value):
+        """
+        :return: a new action whose index-th parameter is replaced by value
+        """
+        parameters = list(self.parameters)
+        parameters[index] = value
+        return Action(self.act, parameters)
 
     def add_parameter(self, type, value):
-        self.parameters.append((type, value))
+        """
+        :return: a new action with (type, value) appended to the parameters
+        """
+        return Action(self.act, list(self.parameters) + [(type, value)])
 
     def dump_string(self):
         str_paras = []
@@ -109,8 +148,8 @@ class State(object):
         :param speaker: SYS or USR
         :param actions: a list of Action
         """
-        # make a deep copy of actions
-        self.history.append((speaker, copy.deepcopy(actions)))
+        # actions are immutable, only the list is copied
+        self.history.append((speaker, list(actions)))
 
 
 class SystemAct(object):
@@ -6,17 +6,96 @@ import numpy as np
 from simdial.agent.core import SystemAct, UserAct, BaseUsrSlot
 from simdial.agent import core
 import json
-import copy
+
+
+class Lexicon(object):
+    """
+    The surface strings of a domain, pre-rendered when the domain is loaded. Every (inform template, value)
+    of a slot and every confirm sentence of a user slot value is formatted once into a flat table, so
+    lexicalizing an action is an index lookup. A slot with more than MAX_SURFACES inform surfaces, e.g. the
+    DEFAULT slot of a large database, is formatted on the fly instead.
+
+    :ivar surfaces: the flat table of surface strings
+    :ivar informs: slot_name -> (offset, num_templates, dim). The surface of template t and value v is at
+    offset + t * dim + v.
+    :ivar explicit_confirms: usr slot_name -> offset. The surface of value v is at offset + v.
+    :ivar implicit_confirms: usr slot_name -> offset. The surface of value v is at offset + v.
+    """
+
+    MAX_SURFACES = 2**16
+    EXPLICIT_CONFIRM = "%sで探してよろしいでしょうか。"
+    IMPLICIT_CONFIRM = "I believe you said %s."
+
+    def __init__(self, usr_slots, sys_slots):
+        """
+        :param usr_slots: a list of Slot
+        :param sys_slots: a list of Slot
+        """
+        self.surfaces = []
+        self.informs = {}
+        self.explicit_confirms = {}
+        self.implicit_confirms = {}
+
+        for slot in usr_slots + sys_slots:
+            if slot.informs and len(slot.informs) * slot.dim <= self.MAX_SURFACES:
+                self.informs[slot.name] = (len(self.surfaces), len(slot.informs), slot.dim)
+                for template in slot.informs:
+                    self.surfaces.extend(template % v for v in slot.vocabulary)
+
+        for slot in usr_slots:
+            self.explicit_confirms[slot.name] = len(self.surfaces)
+            self.surfaces.extend(self.EXPLICIT_CONFIRM % v for v in slot.vocabulary)
+            self.implicit_confirms[slot.name] = len(self.surfaces)
+            self.surfaces.extend(self.IMPLICIT_CONFIRM % v for v in slot.vocabulary)
+
+    def inform(self, slot, value, rng=np.random):
+        """
+        :param slot: a Slot
+        :param value: the value index
+        :param rng: np.random or a RandomPool that picks the template
+        :return: a random inform template of the slot filled with the value
+        """
+        entry = self.informs.get(slot.name)
+        if entry is None:
+            return slot.sample_inform(rng=rng) % slot.vocabulary[value]
+        offset, num_templates, dim = entry
+        return self.surfaces[offset + rng.randint(0, num_templates) * dim + value]
+
+    def explicit_confirm(self, slot_name, value):
+        return self.surfaces[self.explicit_confirms[slot_name] + value]
+
+    def implicit_confirm(self, slot_name, value):
+        return self.surfaces[self.implicit_confirms[slot_name] + value]
 
 
 class AbstractNlg(object):
     """
     Abstract class of NLG
+
+    :ivar fragment_cache: (act, parameters) -> the rendered JSON fragment of a QUERY or KB_RETURN action
     """
 
-    def __init__(self, domain, complexity):
+    FRAGMENT_CACHE_SIZE = 4096
+
+    def __init__(self, domain, complexity, rng=None):
+        """
+        :param rng: np.random or a RandomPool that picks the templates. None for np.random.
+        """
         self.domain = domain
         self.complexity = complexity
+        self.rng = np.random if rng is None else rng
+        self.fragment_cache = {}
+
+    def cache_fragment(self, key, fragment):
+        """
+        Remember a rendered fragment. The cache is emptied when it is full.
+
+        :return: the fragment
+        """
+        if len(self.fragment_cache) >= self.FRAGMENT_CACHE_SIZE:
+            self.fragment_cache.clear()
+        self.fragment_cache[key] = fragment
+        return fragment
 
     def generate_sent(self, actions, **kwargs):
         """
@@ -28,7 +107,7 @@ class AbstractNlg(object):
         raise NotImplementedError("Generate sent is required for NLG")
 
     def sample(self, examples):
-        return np.random.choice(examples)
+        return self.rng.choice(examples)
 
 
 class SysCommonNlg(object):
@@ -62,7 +141,7 @@ class SysNlg(AbstractNlg):
         str_actions = []
         lexicalized_actions = []
         for a in actions:
-            a_copy = copy.deepcopy(a)
+            lex_action = a
             if a.act == SystemAct.GREET:
                 if domain:
                     str_actions.append(domain.greet)
@@ -73,19 +152,25 @@ class SysNlg(AbstractNlg):
                 usr_constrains = a.parameters[0]
                 sys_goals = a.parameters[1]
 
-                # create string list for KB_SEARCH
-                search_dict = {}
-                for k, v in usr_constrains:
-                    slot = self.domain.get_usr_slot(k)
-                    if v is None:
-                        search_dict[k] = 'dont_care'
-                    else:
-                        search_dict[k] = slot.vocabulary[v]
-
-                a_copy.parameters[0] = search_dict
-                a_copy.parameters[1] = sys_goals
-                str_actions.append(json.dumps({"QUERY": search_dict,
-                                               "GOALS": sys_goals}, ensure_ascii=False))
+                key = (a.act, tuple(usr_constrains), tuple(sys_goals))
+                fragment = self.fragment_cache.get(key)
+                if fragment is None:
+                    # create string list for KB_SEARCH
+                    search_dict = {}
+                    for k, v in usr_constrains:
+                        slot = self.domain.get_usr_slot(k)
+                        if v is None:
+                            search_dict[k] = 'dont_care'
+                        else:
+                            search_dict[k] = slot.vocabulary[v]
+                    fragment = self.cache_fragment(key, (search_dict, json.dumps({"QUERY": search_dict,
+                                                                                   "GOALS": sys_goals},
+                                                                                  ensure_ascii=False)))
+                search_dict, query_str = fragment
+
+                # every lexicalized action gets its own copy of the cached dict
+                lex_action = a.replace_parameter(0, dict(search_dict))
+                str_actions.append(query_str)
 
             elif a.act == SystemAct.INFORM:
                 sys_goals = a.parameters[1]
@@ -101,9 +186,8 @@ class SysNlg(AbstractNlg):
                         prefix = "Yes, " if v == e_v else "No, "
                     else:
                         prefix = ""
-                    informs.append(prefix + slot.sample_inform()
-                                   % slot.vocabulary[v])
-                a_copy['parameters'] = [sys_goal_dict]
+                    informs.append(prefix + self.domain.lexicon.inform(slot, v, self.rng))
+                lex_action = a.with_parameters([sys_goal_dict])
                 str_actions.append(" ".join(informs))
 
             elif a.act == SystemAct.REQUEST:
@@ -114,29 +198,27 @@ class SysNlg(AbstractNlg):
                     target_slot = self.domain.get_usr_slot(slot_type)
                     if target_slot is None:
                         raise ValueError("none slot %s" % slot_type)
-                    str_actions.append(target_slot.sample_request())
+                    str_actions.append(target_slot.sample_request(rng=self.rng))
 
             elif a.act == SystemAct.EXPLICIT_CONFIRM:
                 slot_type, slot_val = a.parameters[0]
                 if slot_val is None:
                     str_actions.append(self.sample(templates[SystemAct.EXPLICIT_CONFIRM+"dont_care"]))
-                    a_copy.parameters[0] = (slot_type, "dont_care")
+                    lex_action = a.replace_parameter(0, (slot_type, "dont_care"))
                 else:
                     slot = self.domain.get_usr_slot(slot_type)
-                    str_actions.append("%sで探してよろしいでしょうか。"
-                                       % slot.vocabulary[slot_val])
-                    a_copy.parameters[0] = (slot_type, slot.vocabulary[slot_val])
+                    str_actions.append(self.domain.lexicon.explicit_confirm(slot_type, slot_val))
+                    lex_action = a.replace_parameter(0, (slot_type, slot.vocabulary[slot_val]))
 
             elif a.act == SystemAct.IMPLICIT_CONFIRM:
                 slot_type, slot_val = a.parameters[0]
                 if slot_val is None:
                     str_actions.append(self.sample(templates[SystemAct.IMPLICIT_CONFIRM+"dont_care"]))
-                    a_copy.parameters[0] = (slot_type, "dont_care")
+                    lex_action = a.replace_parameter(0, (slot_type, "dont_care"))
                 else:
                     slot = self.domain.get_usr_slot(slot_type)
-                    str_actions.append("I believe you said %s."
-                                       % slot.vocabulary[slot_val])
-                    a_copy.parameters[0] = (slot_type, slot.vocabulary[slot_val])
+                    str_actions.append(self.domain.lexicon.implicit_confirm(slot_type, slot_val))
+                    lex_action = a.replace_parameter(0, (slot_type, slot.vocabulary[slot_val]))
 
             elif a.act in templates.keys():
                 str_actions.append(self.sample(templates[a.act]))
@@ -144,7 +226,7 @@ class SysNlg(AbstractNlg):
             else:
                 raise ValueError("Unknown dialog act %s" % a.act)
 
-            lexicalized_actions.append(a_copy)
+            lexicalized_actions.append(lex_action)
 
         return " ".join(str_actions), lexicalized_actions
 
@@ -165,12 +247,16 @@ class UserNlg(AbstractNlg):
         for a in actions:
             if a.act == UserAct.KB_RETURN:
                 sys_goals = a.parameters[1]
-                sys_goal_dict = {}
-                for k, v in sys_goals.items():
-                    slot = self.domain.get_sys_slot(k)
-                    sys_goal_dict[k] = slot.vocabulary[v]
-
-                str_actions.append(json.dumps({"RET": sys_goal_dict}, ensure_ascii=False))
+                key = (a.act, tuple(sys_goals.items()))
+                ret_str = self.fragment_cache.get(key)
+                if ret_str is None:
+                    sys_goal_dict = {}
+                    for k, v in sys_goals.items():
+                        slot = self.domain.get_sys_slot(k)
+                        sys_goal_dict[k] = slot.vocabulary[v]
+                    ret_str = self.cache_fragment(key, json.dumps({"RET": sys_goal_dict}, ensure_ascii=False))
+
+                str_actions.append(ret_str)
             elif a.act == UserAct.GREET:
                 str_actions.append(self.sample(["挨拶。(こんにちは等)"]))
 
@@ -180,7 +266,7 @@ class UserNlg(AbstractNlg):
             elif a.act == UserAct.REQUEST:
                 slot_type, _ = a.parameters[0]
                 target_slot = self.domain.get_sys_slot(slot_type)
-                str_actions.append(target_slot.sample_request())
+                str_actions.append(target_slot.sample_request(rng=self.rng))
 
             elif a.act == UserAct.INFORM:
                 has_self_correct = a.parameters[-1][0] == BaseUsrSlot.SELF_CORRECT
@@ -194,10 +280,10 @@ class UserNlg(AbstractNlg):
                         if slot_type == "#food_pref":
                             return self.sample(["食べ物は何でも大丈夫です。", "食べるものは特に気にしません。"])
                     else:
-                        return target_slot.sample_inform() % target_slot.vocabulary[val]
+                        return self.domain.lexicon.inform(target_slot, val, self.rng)
 
                 if has_self_correct:
-                    wrong_value = target_slot.sample_different(slot_value)
+                    wrong_value = target_slot.sample_different(slot_value, rng=self.rng)
                     wrong_utt = get_inform_utt(wrong_value)
                     correct_utt = get_inform_utt(slot_value)
                     connector = self.sample(["Oh no,", "Uhm sorry,", "Oh sorry,"])
@@ -213,7 +299,7 @@ class UserNlg(AbstractNlg):
                 slot_type, expect_id = a.parameters[0]
                 target_slot = self.domain.get_sys_slot(slot_type)
                 expect_val = target_slot.vocabulary[expect_id]
-                str_actions.append(target_slot.sample_yn_question(expect_val))
+                str_actions.append(target_slot.sample_yn_question(expect_val, rng=self.rng))
 
             elif a.act == UserAct.CONFIRM:
                 str_actions.append(self.sample(["はい", "そうです", "それで合っています", "うん", "ok"]))
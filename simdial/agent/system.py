@@ -2,17 +2,18 @@
 # author: Tiancheng Zhao
 
 from simdial.agent.core import Agent, Action, State, SystemAct, UserAct, BaseSysSlot, BaseUsrSlot
+from simdial.tracing import recorder
 import logging
 from collections import OrderedDict
 import numpy as np
-import copy
 
 
 class BeliefSlot(object):
     """
     A slot with a probabilistic distribution over the possible values
     
-    :ivar value_map: entity_value -> (score, norm_value)
+    :ivar scores: float array of the confidence of each value. Index 0 is the None value (dont care) and index
+    v+1 is the value v. -inf marks the values that are never observed.
     :ivar last_update_turn: the last turn ID this slot is modified
     :ivar uid: the unique ID, i.e. slot name
     """
@@ -23,56 +24,75 @@ class BeliefSlot(object):
 
     def __init__(self, uid, vocabulary):
         self.uid = uid
-        self.value_map = {}
+        self.scores = np.full(len(vocabulary) + 1, -np.inf)
         self.last_update_turn = -1
-        self.logger = logging.getLogger(__name__)
+        self._max_idx = None
+
+    def _refresh(self):
+        """
+        Cache the index of the max confidence. Ties go to the larger value and None is the smallest one.
+        """
+        max_idx = len(self.scores) - 1 - np.argmax(self.scores[::-1])
+        self._max_idx = None if self.scores[max_idx] == -np.inf else max_idx
 
     def add_new_observation(self, value, conf, turn_id):
         self.last_update_turn = turn_id
+        idx = 0 if value is None else value + 1
 
-        if value in self.value_map.keys():
-            prev_conf = self.value_map[value]
-            self.value_map[value] = max([prev_conf, conf]) + 0.2
-            self.logger.info("Update %s conf to %f at turn %d" % (value, conf, turn_id))
+        if self.scores[idx] != -np.inf:
+            prev_conf = self.scores[idx]
+            self.scores[idx] = max([prev_conf, conf]) + 0.2
+            if recorder.active:
+                recorder.event('update', slot=self.uid, value=value, conf=conf, turn=turn_id)
         else:
-            self.value_map = {k: c/2 for k, c in self.value_map.items()}
-            self.value_map[value] = conf
-            self.logger.info("Add %s conf as %f at turn %d" % (value, conf, turn_id))
+            # unobserved values stay -inf
+            self.scores /= 2
+            self.scores[idx] = conf
+            if recorder.active:
+                recorder.event('add', slot=self.uid, value=value, conf=conf, turn=turn_id)
+        self._refresh()
 
     def add_grounding(self, confirm_conf, disconfirm_conf, turn_id, target_value=None):
-        if len(self.value_map) > 0:
+        if self._max_idx is not None:
             self.last_update_turn = turn_id
             if target_value is None:
                 grounded_value = self.get_maxconf_value()
+                idx = self._max_idx
             else:
                 grounded_value = target_value
+                idx = target_value + 1
             up_conf = confirm_conf * (1.0 - self.EXPLICIT_THRESHOLD)
             down_conf = disconfirm_conf * (1.0 - self.EXPLICIT_THRESHOLD)
-            old_conf = self.value_map[grounded_value]
+            old_conf = self.scores[idx]
+            if old_conf == -np.inf:
+                # a value that was never observed has no confidence to ground
+                raise KeyError(grounded_value)
             new_conf = max(0.0, min((old_conf + up_conf - down_conf), 1.5))
-            self.value_map[grounded_value] = new_conf
-            self.logger.info(
-                "Ground %s from %f to %f at turn %d" % (grounded_value, old_conf, new_conf, turn_id))
-        else:
-            self.logger.warn("Warn an concept without value")
+            self.scores[idx] = new_conf
+            self._refresh()
+            if recorder.active:
+                recorder.event('ground', slot=self.uid, value=grounded_value, old_conf=old_conf,
+                               new_conf=new_conf, turn=turn_id)
+        elif recorder.active:
+            recorder.event('ground_empty', slot=self.uid, turn=turn_id)
 
     def get_maxconf_value(self):
-        if len(self.value_map) == 0:
+        if self._max_idx is None or self._max_idx == 0:
             return None
-        max_s, max_v = max([(s, v) for v, s in self.value_map.items()])
-        return max_v
+        return int(self._max_idx - 1)
 
     def max_conf(self):
         """
         :return: the highest confidence of all potential values. 0.0 if its empty 
         """
-        if len(self.value_map) == 0:
+        if self._max_idx is None:
             return 0.0
-        return max([s for s in self.value_map.values()])
+        return float(self.scores[self._max_idx])
 
     def clear(self, turn_id):
         middle = (self.IMPLICIT_THRESHOLD+self.EXPLICIT_THRESHOLD)/2.
-        self.value_map = {k: middle for k in self.value_map.keys()}
+        self.scores[self.scores != -np.inf] = middle
+        self._refresh()
 
 
 class BeliefGoal(object):
@@ -1,9 +1,9 @@
 # -*- coding: utf-8 -*-
 # author: Tiancheng Zhao
 from simdial.agent.core import Agent, Action, UserAct, SystemAct, BaseSysSlot, BaseUsrSlot, State
+from simdial.tracing import recorder
 import logging
 import numpy as np
-import copy
 from collections import OrderedDict
 
 
@@ -14,6 +14,7 @@ class User(Agent):
     :ivar usr_constrains: a combination of user slots
     :ivar domain: the given domain
     :ivar state: the dialog state
+    :ivar rng: np.random or a RandomPool that draws every random choice of the user
     """
 
     logger = logging.getLogger(__name__)
@@ -71,9 +72,10 @@ class User(Agent):
         def reset_goal(self, sys_goals):
             self.goals_met = {g: False for g in sys_goals}
 
-    def __init__(self, domain, complexity):
+    def __init__(self, domain, complexity, rng=None):
         super(User, self).__init__(domain, complexity)
-        self.goal_cnt = np.random.choice(complexity.multi_goals.keys(), p=complexity.multi_goals.values())
+        self.rng = np.random if rng is None else rng
+        self.goal_cnt = complexity.multi_goals.draw(self.rng)
         self.goal_ptr = 0
         self.usr_constrains, self.sys_goals = self._sample_goal()
         self.state = self.DialogState(self.sys_goals)
@@ -86,24 +88,25 @@ class User(Agent):
         """
         self.state.update_history(self.state.SYS, sys_actions)
         self.state.spk_state = self.DialogState.SPEAK
-        self.state.input_buffer = copy.deepcopy(sys_actions)
+        self.state.input_buffer = list(sys_actions)
 
     def _sample_goal(self):
         """
         :return: {slot_name -> value} for user constrains, [slot_name, ..] for system goals
         """
-        temp_constrains = self.domain.db.sample_unique_row().tolist()
-        temp_constrains = [None if np.random.rand() < self.complexity.dont_care
+        temp_constrains = self.domain.db.sample_unique_row(rng=self.rng).tolist()
+        temp_constrains = [None if self.rng.rand() < self.complexity.dont_care
                            else c for c in temp_constrains]
         # there is a chance user does not care
         usr_constrains = {s.name: temp_constrains[i] for i, s in enumerate(self.domain.usr_slots)}
 
         # sample the number of attribute about the system
-        num_interest = np.random.randint(0, len(self.domain.sys_slots)-1)
+        num_interest = self.rng.randint(0, len(self.domain.sys_slots)-1)
         goal_candidates = [s.name for s in self.domain.sys_slots if s.name != BaseSysSlot.DEFAULT]
-        selected_goals = np.random.choice(goal_candidates, size=num_interest, replace=False)
-        np.random.shuffle(selected_goals)
-        sys_goals = [BaseSysSlot.DEFAULT] + selected_goals.tolist()
+        selected_goals = [goal_candidates[i] for i in
+                          self.rng.choice(len(goal_candidates), size=num_interest, replace=False)]
+        self.rng.shuffle(selected_goals)
+        sys_goals = [BaseSysSlot.DEFAULT] + selected_goals
         return usr_constrains, sys_goals
 
     def _constrain_equal(self, top_action):
@@ -122,13 +125,14 @@ class User(Agent):
         else:
             self.goal_ptr += 1
             _, self.sys_goals = self._sample_goal()
-            change_key = np.random.choice(self.usr_constrains.keys())
+            usr_keys = self.usr_constrains.keys()
+            change_key = usr_keys[self.rng.randint(0, len(usr_keys))]
             change_slot = self.domain.get_usr_slot(change_key)
             old_value = self.usr_constrains[change_key]
             old_value = -1 if old_value is None else old_value
-            new_value = np.random.randint(0, change_slot.dim-1) % change_slot.dim
-            self.logger.info("Filp user constrain %s from %d to %d" %
-                             (change_key, old_value, new_value))
+            new_value = self.rng.randint(0, change_slot.dim-1) % change_slot.dim
+            if recorder.active:
+                recorder.event('flip_goal', slot=change_key, old_value=old_value, new_value=new_value)
             self.usr_constrains[change_key] = new_value
             self.state.reset_goal(self.sys_goals)
             return change_key
@@ -166,8 +170,7 @@ class User(Agent):
                 if slot_val == self.usr_constrains[slot_type] or self.usr_constrains[slot_type] is None:
                     return None
                 else:
-                    strategy = np.random.choice(self.complexity.reject_style.keys(),
-                                                p=self.complexity.reject_style.values())
+                    strategy = self.complexity.reject_style.draw(self.rng)
                     if strategy == "reject":
                         return Action(UserAct.DISCONFIRM, (slot_type, slot_val))
                     elif strategy == "reject+inform":
@@ -212,10 +215,10 @@ class User(Agent):
                                 Action(UserAct.GOODBYE)]
                 else:
                     ack_act = Action(UserAct.MORE_REQUEST, [(g, None) for g in complete_goals])
-                    if np.random.rand() < self.complexity.yn_question:
+                    if self.rng.rand() < self.complexity.yn_question:
                         # find a system slot with yn_templates
                         slot = self.domain.get_sys_slot(next_goal)
-                        expected_val = np.random.randint(0, slot.dim)
+                        expected_val = self.rng.randint(0, slot.dim)
                         if len(slot.yn_questions.get(slot.vocabulary[expected_val], [])) > 0:
                             # sample a expected value
                             return [ack_act, Action(UserAct.YN_QUESTION, (slot.name, expected_val))]
@@ -243,14 +246,13 @@ class User(Agent):
 
             elif self.domain.is_usr_slot(slot_type):
                 if len(self.domain.usr_slots) > 1:
-                    num_informs = np.random.choice(self.complexity.multi_slots.keys(),
-                                                   p=self.complexity.multi_slots.values(),
-                                                   replace=False)
+                    num_informs = self.complexity.multi_slots.draw(self.rng)
                     if num_informs > 1:
                         candidates = [k for k, v in self.usr_constrains.items() if k != slot_type and v is not None]
                         num_extra = min(num_informs-1, len(candidates))
                         if num_extra > 0:
-                            extra_keys = np.random.choice(candidates, size=num_extra, replace=False)
+                            extra_keys = [candidates[i] for i in
+                                          self.rng.choice(len(candidates), size=num_extra, replace=False)]
                             actions = [Action(UserAct.INFORM, (key, self.usr_constrains[key])) for key in extra_keys]
                             actions.insert(0, Action(UserAct.INFORM, (slot_type, self.usr_constrains[slot_type])))
                             return actions
@@ -273,23 +275,19 @@ class User(Agent):
             last_usr_actions = self.state.last_actions(self.state.USR)
             if last_usr_actions is None:
                 raise ValueError("Unexpected ask rephrase")
-            for a in last_usr_actions:
-                a.add_parameter(BaseUsrSlot.AGAIN, True)
-            return last_usr_actions
+            return [a.add_parameter(BaseUsrSlot.AGAIN, True) for a in last_usr_actions]
 
         elif top_action.act == SystemAct.QUERY:
             query, goals = top_action.parameters[0], top_action.parameters[1]
-            valid_entries = self.domain.db.select([v for name, v in query])
-            chosen_entry = valid_entries[np.random.randint(0, len(valid_entries)), :]
+            row_id = self.domain.db.sample_match([v for name, v in query], rng=self.rng)
+            if row_id is None:
+                raise ValueError("No valid entries")
+            chosen_entry = self.domain.db.sys_table[row_id]
 
             results = {}
-            if chosen_entry.shape[0] > 0:
-                for goal in goals:
-                    _, slot_id = self.domain.get_sys_slot(goal, return_idx=True)
-                    results[goal] = chosen_entry[slot_id]
-            else:
-                print(chosen_entry)
-                raise ValueError("No valid entries")
+            for goal in goals:
+                _, slot_id = self.domain.get_sys_slot(goal, return_idx=True)
+                results[goal] = int(chosen_entry[slot_id])
 
             return Action(UserAct.KB_RETURN, [query, results])
         else:
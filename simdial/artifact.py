@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+# author: Tiancheng Zhao
+"""
+Compile a DomainSpec into an on-disk artifact that loads in milliseconds. An artifact folder contains
+
+    manifest.json   the artifact version and the hash of the spec it was compiled from
+    domain.pkl      the Domain without its database (slots, NLG templates and lexicon, lookup maps)
+    db/             the Database snapshot, memory-mapped at load time
+
+    python -m simdial.artifact multiple_domains:RestSpec restaurant.domain
+"""
+from simdial.domain import Domain
+from simdial.database import Database
+import argparse
+import importlib
+import hashlib
+import logging
+import json
+import os
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+# bump it whenever the layout of Domain or Database changes
+ARTIFACT_VERSION = 2
+
+logger = logging.getLogger(__name__)
+
+
+def spec_hash(domain_spec):
+    """
+    :param domain_spec: an implementation of DomainSpec
+    :return: the hex digest that keys an artifact to its spec and to ARTIFACT_VERSION
+    """
+    payload = json.dumps({'version': ARTIFACT_VERSION, 'spec': domain_spec.to_dict()}, sort_keys=True)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def is_fresh(domain_spec, path):
+    """
+    :return: True if path holds a complete artifact compiled from the same spec and version
+    """
+    manifest_path = os.path.join(path, "manifest.json")
+    if not os.path.exists(manifest_path):
+        return False
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    return manifest.get('version') == ARTIFACT_VERSION and manifest.get('hash') == spec_hash(domain_spec)
+
+
+def compile_domain(domain_spec, path, db_cache_size=0):
+    """
+    Build the Domain of the spec and save it as an artifact.
+
+    :param domain_spec: an implementation of DomainSpec
+    :param path: the artifact folder
+    :param db_cache_size: the size of the LRU query cache of the returned domain
+    :return: the compiled Domain
+    """
+    if not os.path.exists(path):
+        os.makedirs(path)
+    # the manifest is written last, so an interrupted compile is never taken as fresh
+    manifest_path = os.path.join(path, "manifest.json")
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+
+    domain = Domain(domain_spec, db_cache_size=db_cache_size)
+    domain.db.save(os.path.join(path, "db"))
+
+    state = dict(domain.__dict__)
+    state.pop('db')
+    with open(os.path.join(path, "domain.pkl"), "wb") as f:
+        pickle.dump(state, f, pickle.HIGHEST_PROTOCOL)
+
+    with open(manifest_path, "w") as f:
+        json.dump({'version': ARTIFACT_VERSION, 'hash': spec_hash(domain_spec),
+                   'name': domain_spec.name, 'db_size': domain_spec.db_size}, f, indent=2)
+    logger.info("Compiled domain %s to %s" % (domain_spec.name, path))
+    return domain
+
+
+def load_domain(domain_spec, path, db_cache_size=0, rebuild=True):
+    """
+    Load the Domain of the spec from its artifact. The database is memory-mapped.
+
+    :param domain_spec: an implementation of DomainSpec
+    :param path: the artifact folder
+    :param db_cache_size: the size of the LRU query cache of the database
+    :param rebuild: compile the artifact again if it is missing or stale. Otherwise raise ValueError.
+    :return: a Domain
+    """
+    if not is_fresh(domain_spec, path):
+        if not rebuild:
+            raise ValueError("Domain artifact %s is missing or stale for %s" % (path, domain_spec.name))
+        return compile_domain(domain_spec, path, db_cache_size=db_cache_size)
+
+    with open(os.path.join(path, "domain.pkl"), "rb") as f:
+        state = pickle.load(f)
+    domain = Domain.__new__(Domain)
+    domain.__dict__.update(state)
+    domain.db = Database.load(os.path.join(path, "db"), cache_size=db_cache_size)
+    return domain
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('spec', help="the DomainSpec class as module:ClassName")
+    parser.add_argument('path', help="the artifact folder")
+    parser.add_argument('--force', action='store_true', help="compile even if the artifact is fresh")
+    args = parser.parse_args()
+
+    module_name, class_name = args.spec.split(":")
+    spec = getattr(importlib.import_module(module_name), class_name)()
+    if args.force or not is_fresh(spec, args.path):
+        compile_domain(spec, args.path)
+        print("compiled %s -> %s" % (args.spec, args.path))
+    else:
+        print("%s is up to date" % args.path)
@@ -2,13 +2,16 @@
 # author: Tiancheng Zhao
 import numpy as np
 from simdial.agent.core import UserAct, BaseUsrSlot
-import copy
 
 
 class AbstractNoise(object):
-    def __init__(self, domain, complexity):
+    def __init__(self, domain, complexity, rng=None):
+        """
+        :param rng: np.random or a RandomPool. None for np.random.
+        """
         self.complexity = complexity
         self.domain = domain
+        self.rng = np.random if rng is None else rng
 
     def transmit(self, actions):
         raise NotImplementedError
@@ -18,12 +21,12 @@ class AbstractNoise(object):
 
 
 class EnvironmentNoise(AbstractNoise):
-    def __init__(self, domain, complexity):
-        super(EnvironmentNoise, self).__init__(domain, complexity)
+    def __init__(self, domain, complexity, rng=None):
+        super(EnvironmentNoise, self).__init__(domain, complexity, rng=rng)
         self.dim_map = {slot.name: slot.dim for slot in domain.usr_slots}
 
     def transmit(self, actions):
-        conf = np.random.normal(self.complexity.asr_acc, self.complexity.asr_std)
+        conf = self.rng.normal(self.complexity.asr_acc, self.complexity.asr_std)
         conf = np.clip(conf, 0.1, 0.99)
         noisy_actions = []
         # check has yes no
@@ -37,16 +40,16 @@ class EnvironmentNoise(AbstractNoise):
 
         for a in actions:
             if a.act == UserAct.CONFIRM:
-                if np.random.rand() > conf:
-                    a.act = UserAct.DISCONFIRM
+                if self.rng.rand() > conf:
+                    a = a.with_act(UserAct.DISCONFIRM)
             elif a.act == UserAct.DISCONFIRM:
-                if np.random.rand() > conf:
-                    a.act = UserAct.CONFIRM
+                if self.rng.rand() > conf:
+                    a = a.with_act(UserAct.CONFIRM)
             elif a.act == UserAct.INFORM:
-                if np.random.rand() > conf:
+                if self.rng.rand() > conf:
                     slot, value = a.parameters[0]
                     choices = range(self.dim_map[slot]) + [None]
-                    a.parameters[0] = (slot, np.random.choice(choices))
+                    a = a.replace_parameter(0, (slot, self.rng.choice(choices)))
 
             noisy_actions.append(a)
 
@@ -55,37 +58,59 @@ class EnvironmentNoise(AbstractNoise):
 
 class InteractionNoise(AbstractNoise):
 
+    FILLERS = ["hmm", "uhm", "hmm ...", ]
+
     def transmit(self, actions):
         return self.add_self_correct(actions)
 
     def transmit_words(self, utt):
+        return self.apply_word_noise(utt, self.sample_word_noise(utt))
+
+    def sample_word_noise(self, utt):
+        """
+        Decide the hesitation and the self-restart of an utterance.
+
+        :return: (hesitation_pos, filler_id, restart_len). hesitation_pos and restart_len are 0 if the noise is
+        not applied.
+        """
+        num_tokens = len(utt.split(" "))
+        pos, filler = 0, 0
         # hesitation
-        utt = self.add_hesitation(utt)
+        if num_tokens > 4 and self.rng.rand() < self.complexity.hesitation:
+            pos = self.rng.randint(1, num_tokens-1)
+            filler = self.rng.randint(0, len(self.FILLERS))
+            num_tokens += len(self.FILLERS[filler].split(" "))
 
         # self-restart
-        return self.add_self_restart(utt)
-
-    def add_hesitation(self, utt):
-        tokens = utt.split(" ")
-        if len(tokens) > 4 and  np.random.rand() < self.complexity.hesitation:
-            pos = np.random.randint(1, len(tokens)-1)
-            tokens.insert(pos, np.random.choice(["hmm", "uhm", "hmm ...",]))
-            return " ".join(tokens)
-        return utt
+        length = 0
+        if num_tokens > 4 and self.rng.rand() < self.complexity.self_restart:
+            length = self.rng.randint(1, 3)
+        return pos, filler, length
 
-    def add_self_restart(self, utt):
-        tokens = utt.split(" ")
-        if len(tokens) > 4 and np.random.rand() < self.complexity.self_restart:
-            length = np.random.randint(1, 3)
+    @classmethod
+    def apply_word_noise(cls, utt, noise):
+        """
+        :param noise: (hesitation_pos, filler_id, restart_len) from sample_word_noise
+        :return: the noisy utterance
+        """
+        pos, filler, length = noise
+        if pos > 0:
+            tokens = utt.split(" ")
+            tokens.insert(pos, cls.FILLERS[filler])
+            utt = " ".join(tokens)
+        if length > 0:
+            tokens = utt.split(" ")
             tokens = tokens[0:length] + ["uhm yeah"] + tokens
-            return " ".join(tokens)
+            utt = " ".join(tokens)
         return utt
 
     def add_self_correct(self, actions):
+        noisy_actions = []
         for a in actions:
-            if a.act == UserAct.INFORM and np.random.rand() < self.complexity.self_correct:
-                a.parameters.append((BaseUsrSlot.SELF_CORRECT, True))
-        return actions
+            if a.act == UserAct.INFORM and self.rng.rand() < self.complexity.self_correct:
+                a = a.add_parameter(BaseUsrSlot.SELF_CORRECT, True)
+            noisy_actions.append(a)
+        return noisy_actions
 
 
 class SocialNoise(AbstractNoise):
@@ -100,10 +125,10 @@ class ActionChannel(object):
     A class to simulate the complex behviaor of human-computer conversation.
     """
 
-    def __init__(self, domain, complexity):
-        self.environment = EnvironmentNoise(domain, complexity)
-        self.interaction = InteractionNoise(domain, complexity)
-        self.social = SocialNoise(domain, complexity)
+    def __init__(self, domain, complexity, rng=None):
+        self.environment = EnvironmentNoise(domain, complexity, rng=rng)
+        self.interaction = InteractionNoise(domain, complexity, rng=rng)
+        self.social = SocialNoise(domain, complexity, rng=rng)
 
     def transmit2sys(self, actions):
         """
@@ -112,8 +137,7 @@ class ActionChannel(object):
         :param actions: a list of clean action from the user to the system
         :return: a list of corrupted actions.
         """
-        action_copy = [copy.deepcopy(a) for a in actions]
-        noisy_actions = self.interaction.transmit(action_copy)
+        noisy_actions = self.interaction.transmit(actions)
         noisy_actions = self.social.transmit(noisy_actions)
         noisy_actions, conf = self.environment.transmit(noisy_actions)
         return noisy_actions, conf
@@ -124,14 +148,19 @@ class WordChannel(object):
     A class to simulate the complex behviaor of human-computer conversation.
     """
 
-    def __init__(self, domain, complexity):
-        self.interaction = InteractionNoise(domain, complexity)
+    def __init__(self, domain, complexity, rng=None):
+        self.interaction = InteractionNoise(domain, complexity, rng=rng)
 
-    def transmit2sys(self, utt):
+    def transmit2sys(self, utt, return_noise=False):
         """
-        Given a list of action from a user to a system, add noise to the actions.
+        Given an utterance from a user to a system, add noise to the words.
 
-        :param actions: a list of clean action from the user to the system
-        :return: a list of corrupted actions.
+        :param utt: the clean utterance
+        :param return_noise: True to also return the word noise applied, see InteractionNoise.sample_word_noise
+        :return: the corrupted utterance, (noise)
         """
-        return self.interaction.transmit_words(utt)
\ No newline at end of file
+        noise = self.interaction.sample_word_noise(utt)
+        noisy_utt = self.interaction.apply_word_noise(utt, noise)
+        if return_noise:
+            return noisy_utt, noise
+        return noisy_utt
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+# author: Tiancheng Zhao
+"""
+Checkpoints of a long generation run. A checkpoint folder contains
+
+    checkpoint.json         the arguments of the run, its master seed and the stats of every completed shard
+    shard-NNNNNN.*          the part files of the completed shards
+
+A part file is written under a .tmp name and renamed once its shard is complete, and checkpoint.json is
+replaced atomically after the rename, so an interrupted run leaves either a completed shard or nothing.
+The domain artifact of the run is kept outside the folder, so it outlives the checkpoint and a restart samples
+the same database.
+"""
+from simdial.corpus import CorpusStats
+import numpy as np
+import logging
+import shutil
+import json
+import os
+
+CHECKPOINT_VERSION = 1
+
+
+def write_json_atomic(path, data):
+    """
+    Write data as JSON to a temporary file and rename it over path, so readers never see a partial file.
+    """
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+    os.rename(tmp_path, path)
+
+
+class Checkpoint(object):
+    """
+    The completed shards of a run. A run restarted with the same arguments loads them and only generates the
+    others.
+
+    :ivar path: the checkpoint folder
+    :ivar config: the arguments that determine the output, e.g. the spec hash, size and shard size
+    :ivar seed: the master seed of the shards
+    :ivar done: shard id -> CorpusStats of the completed shards
+    """
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, path, config, seed=None):
+        """
+        :param path: the checkpoint folder
+        :param config: a JSON-serializable dict of the arguments of the run
+        :param seed: the master seed. None to reuse the seed of the checkpoint, or to draw a new one.
+        :raise ValueError: if the checkpoint was written by a run with other arguments
+        """
+        self.path = path
+        self.config = json.loads(json.dumps(config))
+        self.done = {}
+        json_path = os.path.join(path, "checkpoint.json")
+        if os.path.exists(json_path):
+            with open(json_path) as f:
+                data = json.load(f)
+            if data['version'] != CHECKPOINT_VERSION or data['config'] != self.config:
+                raise ValueError("Checkpoint %s was written with other arguments: %s" % (path, data['config']))
+            if seed is not None and seed != data['seed']:
+                raise ValueError("Checkpoint %s was written with seed %d" % (path, data['seed']))
+            self.seed = data['seed']
+            self.done = {int(k): CorpusStats.from_dict(v) for k, v in data['done'].items()}
+            self.logger.info("Resume %s with %d completed shards" % (path, len(self.done)))
+        else:
+            if not os.path.exists(path):
+                os.makedirs(path)
+            self.seed = int(np.random.randint(0, 2**31-1)) if seed is None else seed
+            self.save()
+
+    def part_path(self, shard_id, ext):
+        return os.path.join(self.path, "shard-%06d%s" % (shard_id, ext))
+
+    def complete(self, shard_id, stats):
+        """
+        Record a shard whose part files have been renamed to their final names.
+        """
+        self.done[shard_id] = stats
+        self.save()
+
+    def save(self):
+        write_json_atomic(os.path.join(self.path, "checkpoint.json"),
+                          {'version': CHECKPOINT_VERSION,
+                           'config': self.config,
+                           'seed': self.seed,
+                           'num_dialogs': sum(s.num_dialogs for s in self.done.values()),
+                           'done': {str(k): s.to_dict() for k, s in self.done.items()}})
+
+    def remove(self):
+        shutil.rmtree(self.path)
@@ -0,0 +1,294 @@
+# -*- coding: utf-8 -*-
+# author: Tiancheng Zhao
+"""
+The columnar corpus stores every field of the packed turns in its own flat binary column, so a reader can
+memory-map the folder and rebuild any dialog without parsing the others. A corpus folder contains
+
+    manifest.json           the counts, the column dtypes, the id vocabularies and the corpus stats
+    dialog_offsets.bin      the first turn of each dialog, plus the number of turns at the end
+    speaker.bin, conf.bin   one entry per turn. conf is NaN for system turns.
+    action_offsets.bin      the first action of each turn
+    act.bin, slot.bin, value.bin
+                            one entry per action. The act id depends on the speaker. slot and value are the
+                            (slot id, value id) of the first parameter if it is a (slot, value) pair, -1 otherwise
+    utt.bin, actions.bin, state.bin
+                            the utf-8 heaps of the utterances, the JSON of the packed actions and the JSON of the
+                            system states, each indexed by its *_offsets.bin column
+"""
+from simdial.corpus import CorpusStats, JsonlWriter, to_bytes
+from simdial.delex import DelexCodec
+import numpy as np
+import json
+import os
+
+COLUMNAR_VERSION = 1
+
+COLUMNS = [('dialog_offsets', np.int64),
+           ('speaker', np.uint8),
+           ('conf', np.float64),
+           ('action_offsets', np.int64),
+           ('act', np.uint8),
+           ('slot', np.int16),
+           ('value', np.int32),
+           ('utt_offsets', np.int64),
+           ('utt', np.uint8),
+           ('actions_offsets', np.int64),
+           ('actions', np.uint8),
+           ('state_offsets', np.int64),
+           ('state', np.uint8)]
+
+# offset column -> the column it indexes
+OFFSETS = {'dialog_offsets': 'speaker',
+           'action_offsets': 'act',
+           'utt_offsets': 'utt',
+           'actions_offsets': 'actions',
+           'state_offsets': 'state'}
+
+SPEAKERS = ["SYS", "USR"]
+
+
+class ColumnarWriter(object):
+    """
+    Append each dialog to the columns of a corpus folder as soon as it is generated. The manifest is written
+    on close, so a folder without one is incomplete.
+
+    :ivar stats: CorpusStats of the dialogs written so far
+    :ivar codec: the DelexCodec that provides the act and slot ids
+    """
+
+    def __init__(self, path, domain, txt_path=None):
+        """
+        :param path: the corpus folder
+        :param domain: the domain of the dialogs
+        :param txt_path: the TSV file of (speaker, actions, utterance). None to skip it.
+        """
+        if not os.path.exists(path):
+            os.makedirs(path)
+        manifest_path = os.path.join(path, "manifest.json")
+        if os.path.exists(manifest_path):
+            os.remove(manifest_path)
+
+        self.path = path
+        self.domain_name = domain.name
+        self.codec = DelexCodec(domain)
+        self.stats = CorpusStats()
+        self.txt_f = open(txt_path, "wb") if txt_path is not None else None
+        self.files = {name: open(os.path.join(path, name + ".bin"), "wb") for name, _ in COLUMNS}
+        self.lengths = {name: 0 for name, _ in COLUMNS}
+        for name in OFFSETS:
+            self._append(name, [0])
+
+    def _append(self, name, values):
+        arr = np.asarray(values, dtype=dict(COLUMNS)[name])
+        arr.tofile(self.files[name])
+        self.lengths[name] += len(arr)
+
+    def _append_bytes(self, name, data):
+        self.files[name].write(data)
+        self.lengths[name] += len(data)
+        self._append(name + "_offsets", [self.lengths[name]])
+
+    def _action_columns(self, speaker, actions):
+        acts, slots, values = [], [], []
+        for a in actions:
+            acts.append(self.codec.act_ids[speaker][a.act])
+            if a.parameters and self.codec.layout(speaker, a.act, 0) == 'pair':
+                slot, value = a.parameters[0]
+                slots.append(self.codec.slot_ids[slot])
+                values.append(DelexCodec.NONE if value is None else int(value))
+            else:
+                slots.append(DelexCodec.NONE)
+                values.append(DelexCodec.NONE)
+        self._append('act', acts)
+        self._append('slot', slots)
+        self._append('value', values)
+        self._append('action_offsets', [self.lengths['act']])
+
+    def write(self, dialog, one_dialog):
+        """
+        :param dialog: a list of turns packed by Generator.pack_msg
+        :param one_dialog: the action-level trace of the same dialog, which gives the slot and value ids
+        """
+        for turn, (_, raw_actions, _) in zip(dialog, one_dialog):
+            if turn['domain'] != self.domain_name:
+                raise ValueError("Turn of domain %s in a %s corpus" % (turn['domain'], self.domain_name))
+            speaker = SPEAKERS.index(turn['speaker'])
+            self._append('speaker', [speaker])
+            self._append('conf', [turn.get('conf', np.nan)])
+            self._action_columns(speaker, raw_actions)
+            self._append_bytes('utt', to_bytes(turn['utt']))
+            self._append_bytes('actions', to_bytes(json.dumps(turn['actions'], ensure_ascii=False)))
+            state = turn.get('state')
+            state = b"" if state is None else to_bytes(json.dumps(state, ensure_ascii=False))
+            self._append_bytes('state', state)
+        self._append('dialog_offsets', [self.lengths['speaker']])
+
+        if self.txt_f is not None:
+            JsonlWriter.write_txt(self.txt_f, one_dialog)
+        self.stats.add(dialog)
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+        if self.txt_f is not None:
+            self.txt_f.close()
+        self.write_manifest(self.path, self.domain_name, self.codec.to_dict(), self.lengths, self.stats)
+
+    @staticmethod
+    def write_manifest(path, domain_name, vocab, lengths, stats):
+        with open(os.path.join(path, "manifest.json"), "wb") as f:
+            f.write(to_bytes(json.dumps({'version': COLUMNAR_VERSION,
+                                         'domain': domain_name,
+                                         'num_dialogs': lengths['dialog_offsets'] - 1,
+                                         'num_turns': lengths['speaker'],
+                                         'speakers': SPEAKERS,
+                                         'vocab': vocab,
+                                         'columns': {name: {'dtype': np.dtype(dtype).str, 'length': lengths[name]}
+                                                     for name, dtype in COLUMNS},
+                                         'stats': stats.to_dict()}, indent=2, ensure_ascii=False)))
+
+    @staticmethod
+    def concat(part_paths, output_path, chunk_size=2**20, remove=True):
+        """
+        Concatenate the columns of part folders written with the same domain into one folder, rebasing the
+        offsets, and remove the parts, unless remove is False.
+        """
+        manifests = []
+        for path in part_paths:
+            with open(os.path.join(path, "manifest.json"), "rb") as f:
+                manifests.append(json.loads(f.read().decode('utf-8')))
+        if any(m['vocab'] != manifests[0]['vocab'] or m['domain'] != manifests[0]['domain'] for m in manifests):
+            raise ValueError("Cannot concatenate columnar parts of different domains")
+
+        if not os.path.exists(output_path):
+            os.makedirs(output_path)
+        if os.path.exists(os.path.join(output_path, "manifest.json")):
+            os.remove(os.path.join(output_path, "manifest.json"))
+        lengths = {name: 0 for name, _ in COLUMNS}
+        stats = CorpusStats()
+        for name, dtype in COLUMNS:
+            with open(os.path.join(output_path, name + ".bin"), "wb") as out_f:
+                if name in OFFSETS:
+                    np.zeros(1, dtype=dtype).tofile(out_f)
+                    lengths[name] = 1
+                base = 0
+                for path, manifest in zip(part_paths, manifests):
+                    part = _load_column(os.path.join(path, name + ".bin"), dtype, manifest['columns'][name]['length'])
+                    # skip the leading 0 of each part's offsets
+                    start = 1 if name in OFFSETS else 0
+                    for chunk_start in range(start, len(part), chunk_size):
+                        chunk = part[chunk_start:chunk_start+chunk_size]
+                        (chunk + base if name in OFFSETS else chunk).tofile(out_f)
+                    lengths[name] += len(part) - start
+                    if name in OFFSETS:
+                        base += manifest['columns'][OFFSETS[name]]['length']
+
+        for manifest in manifests:
+            stats.merge(CorpusStats.from_dict(manifest['stats']))
+        ColumnarWriter.write_manifest(output_path, manifests[0]['domain'], manifests[0]['vocab'], lengths, stats)
+
+        if not remove:
+            return stats
+        for path in part_paths:
+            for name, _ in COLUMNS:
+                os.remove(os.path.join(path, name + ".bin"))
+            os.remove(os.path.join(path, "manifest.json"))
+            os.rmdir(path)
+        return stats
+
+
+def _load_column(path, dtype, length):
+    """
+    :return: a read-only memory map of a column. np.memmap cannot map an empty file.
+    """
+    if length == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', shape=(length,))
+
+
+class ColumnarReader(object):
+    """
+    Memory-map a columnar corpus. dialog(k) only touches the rows of dialog k.
+
+    :ivar manifest: the manifest of the corpus
+    :ivar columns: column name -> the memory-mapped array
+    """
+
+    def __init__(self, path):
+        """
+        :raise ValueError: if the folder is incomplete or of another version
+        """
+        manifest_path = os.path.join(path, "manifest.json")
+        if not os.path.exists(manifest_path):
+            raise ValueError("Columnar corpus %s is incomplete" % path)
+        with open(manifest_path, "rb") as f:
+            self.manifest = json.loads(f.read().decode('utf-8'))
+        if self.manifest['version'] != COLUMNAR_VERSION:
+            raise ValueError("Columnar corpus %s has version %s" % (path, self.manifest['version']))
+
+        self.columns = {}
+        for name, info in self.manifest['columns'].items():
+            self.columns[name] = _load_column(os.path.join(path, name + ".bin"), np.dtype(info['dtype']),
+                                              info['length'])
+
+    def __len__(self):
+        return self.manifest['num_dialogs']
+
+    def __getitem__(self, k):
+        return self.dialog(k)
+
+    def _heap(self, name, t):
+        offsets = self.columns[name + "_offsets"]
+        return self.columns[name][offsets[t]:offsets[t+1]].tostring().decode('utf-8')
+
+    def turn_range(self, k):
+        """
+        :return: the first turn of dialog k and the turn after its last one
+        """
+        if not 0 <= k < len(self):
+            raise IndexError("Dialog %d out of range" % k)
+        offsets = self.columns['dialog_offsets']
+        return int(offsets[k]), int(offsets[k+1])
+
+    def dialog(self, k):
+        """
+        :return: dialog k as a list of turns, equal to the packed turns after a JSON round trip
+        """
+        start, end = self.turn_range(k)
+        speaker = self.columns['speaker']
+        conf = self.columns['conf']
+        dialog = []
+        for t in range(start, end):
+            turn = {'speaker': SPEAKERS[speaker[t]],
+                    'utt': self._heap('utt', t),
+                    'actions': json.loads(self._heap('actions', t)),
+                    'domain': self.manifest['domain']}
+            if not np.isnan(conf[t]):
+                turn['conf'] = float(conf[t])
+            state = self._heap('state', t)
+            if state:
+                turn['state'] = json.loads(state)
+            dialog.append(turn)
+        return dialog
+
+    def batch(self, ks):
+        """
+        :param ks: the dialog indexes
+        :return: a list of dialogs
+        """
+        return [self.dialog(k) for k in ks]
+
+    def arrays(self, k):
+        """
+        :return: the numeric columns of dialog k as array views: speaker and conf per turn, act/slot/value per
+        action and action_offsets that split the actions into turns, starting at 0
+        """
+        start, end = self.turn_range(k)
+        action_offsets = self.columns['action_offsets'][start:end+1]
+        a_start, a_end = int(action_offsets[0]), int(action_offsets[-1])
+        return {'speaker': self.columns['speaker'][start:end],
+                'conf': self.columns['conf'][start:end],
+                'action_offsets': action_offsets - a_start,
+                'act': self.columns['act'][a_start:a_end],
+                'slot': self.columns['slot'][a_start:a_end],
+                'value': self.columns['value'][a_start:a_end]}
@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 # Author: Tiancheng Zhao
 # Date: 9/13/17
+import numpy as np
+from bisect import bisect_right
 
 
 class ComplexitySpec(object):
@@ -18,6 +20,51 @@ class ComplexitySpec(object):
     social = None
 
 
+class Categorical(object):
+    """
+    A categorical distribution compiled once from a {outcome -> probability} spec into a cumulative array, so
+    a draw costs one uniform and one binary search. Outcomes with zero probability are dropped.
+
+    :ivar outcomes: the outcomes with non-zero probability, in the order of the spec dict
+    :ivar probs: the probabilities of the outcomes
+    :ivar cdf: the cumulative probabilities, whose last entry is exactly 1.0
+    """
+
+    def __init__(self, dist, name="distribution", valid_outcomes=None):
+        """
+        :param dist: {outcome -> probability}
+        :param name: the name of the spec entry used in error messages
+        :param valid_outcomes: a function that returns True for an acceptable outcome. None to accept all.
+        :raise ValueError: if the spec is not a valid distribution
+        """
+        if not isinstance(dist, dict) or len(dist) == 0:
+            raise ValueError("%s must be a non-empty dict of outcome -> probability" % name)
+        for outcome, p in dist.items():
+            if valid_outcomes is not None and not valid_outcomes(outcome):
+                raise ValueError("%s has an invalid outcome %r" % (name, outcome))
+            if isinstance(p, bool) or not isinstance(p, (int, float)) or not np.isfinite(p) or p < 0:
+                raise ValueError("%s has an invalid probability %r for %r" % (name, p, outcome))
+        total = float(sum(dist.values()))
+        if abs(total - 1.0) > 1e-6:
+            raise ValueError("%s sums to %f instead of 1" % (name, total))
+
+        # the order of the spec dict, so the draws match rng.choice(dist.keys(), p=dist.values())
+        self.outcomes = [o for o in dist.keys() if dist[o] > 0]
+        self.probs = [float(dist[o]) for o in self.outcomes]
+        self.cdf = np.cumsum(self.probs).tolist()
+        self.cdf[-1] = 1.0
+
+    def draw(self, rng=np.random):
+        """
+        :param rng: np.random or a RandomPool
+        :return: one outcome
+        """
+        return self.outcomes[bisect_right(self.cdf, rng.rand())]
+
+    def to_dict(self):
+        return dict(zip(self.outcomes, self.probs))
+
+
 class Complexity(object):
     """
     Complexity object used to decides the task difficulities
@@ -37,28 +84,51 @@ class Complexity(object):
     :ivar violation_sn: the chance that system will do VSN
     """
 
+    REJECT_STYLES = ('reject', 'reject+inform')
+
     def __init__(self, complexity_spec):
+        """
+        :raise ValueError: if a distribution or a chance in the spec is malformed
+        """
         # environment
         self.asr_acc = complexity_spec.environment['asr_acc']
         self.asr_std = complexity_spec.environment['asr_std']
 
         # propositional
-        self.yn_question = complexity_spec.proposition['yn_question']
-        self.reject_style = complexity_spec.proposition['reject_style']
-        self.multi_slots = complexity_spec.proposition['multi_slots']
-        self.multi_goals = complexity_spec.proposition['multi_goals']
-        self.dont_care = complexity_spec.proposition['dont_care']
+        self.yn_question = self._chance(complexity_spec.proposition, 'yn_question')
+        self.reject_style = Categorical(complexity_spec.proposition['reject_style'], 'reject_style',
+                                        lambda o: o in self.REJECT_STYLES)
+        self.multi_slots = Categorical(complexity_spec.proposition['multi_slots'], 'multi_slots',
+                                       self._is_count)
+        self.multi_goals = Categorical(complexity_spec.proposition['multi_goals'], 'multi_goals',
+                                       self._is_count)
+        self.dont_care = self._chance(complexity_spec.proposition, 'dont_care')
 
         # interactional
-        self.hesitation = complexity_spec.interaction['hesitation']
-        self.self_restart = complexity_spec.interaction['self_restart']
-        self.self_correct = complexity_spec.interaction['self_correct']
+        self.hesitation = self._chance(complexity_spec.interaction, 'hesitation')
+        self.self_restart = self._chance(complexity_spec.interaction, 'self_restart')
+        self.self_correct = self._chance(complexity_spec.interaction, 'self_correct')
 
         # social
         self.self_disclosure = complexity_spec.social['self_disclosure']
         self.ref_shared = complexity_spec.social['ref_shared']
         self.violation_sn = complexity_spec.social['violation_sn']
 
+    @staticmethod
+    def _is_count(outcome):
+        return isinstance(outcome, int) and not isinstance(outcome, bool) and outcome >= 1
+
+    @staticmethod
+    def _chance(config, key):
+        """
+        :return: config[key] if it is a probability
+        :raise ValueError: otherwise
+        """
+        p = config[key]
+        if isinstance(p, bool) or not isinstance(p, (int, float)) or not 0.0 <= p <= 1.0:
+            raise ValueError("%s must be a probability in [0, 1], got %r" % (key, p))
+        return p
+
     def get_name(self):
         return self.__class__.__name__
 
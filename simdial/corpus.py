@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+# author: Tiancheng Zhao
+import json
+import shutil
+import os
+
+
+def to_bytes(line):
+    """
+    :param line: str or unicode
+    :return: utf-8 encoded bytes that can be written to a file opened in binary mode
+    """
+    if not isinstance(line, bytes):
+        line = line.encode('utf-8')
+    return line
+
+
+class CorpusStats(object):
+    """
+    Running statistics of a corpus that only keep counters, so the memory does not grow with the corpus.
+
+    :ivar num_dialogs: the number of dialogs
+    :ivar total_turns: the number of turns of all dialogs
+    :ivar max_len: the longest dialog
+    :ivar kb_turns: the number of turns that contain a QUERY
+    :ivar kb_ratio_sum: the sum of the QUERY turn ratio of each dialog
+    """
+
+    def __init__(self):
+        self.num_dialogs = 0
+        self.total_turns = 0
+        self.max_len = 0
+        self.kb_turns = 0
+        self.kb_ratio_sum = 0.0
+
+    def add(self, dialog):
+        """
+        :param dialog: a list of turns packed by Generator.pack_msg
+        """
+        local_cnt = 0
+        for t in dialog:
+            if 'QUERY' in t['utt']:
+                local_cnt += 1
+        self.num_dialogs += 1
+        self.total_turns += len(dialog)
+        self.max_len = max(self.max_len, len(dialog))
+        self.kb_turns += local_cnt
+        self.kb_ratio_sum += float(local_cnt) / len(dialog)
+
+    def merge(self, other):
+        self.num_dialogs += other.num_dialogs
+        self.total_turns += other.total_turns
+        self.max_len = max(self.max_len, other.max_len)
+        self.kb_turns += other.kb_turns
+        self.kb_ratio_sum += other.kb_ratio_sum
+
+    def to_dict(self):
+        return {'num_dialogs': self.num_dialogs,
+                'total_turns': self.total_turns,
+                'max_len': self.max_len,
+                'kb_turns': self.kb_turns,
+                'kb_ratio_sum': self.kb_ratio_sum}
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls()
+        stats.__dict__.update(data)
+        return stats
+
+    def pprint(self):
+        """
+        Print the same basic stats as Generator.print_stats
+        """
+        print("%d dialogs" % self.num_dialogs)
+        if self.num_dialogs == 0:
+            return
+        print("Avg len {} Max Len {}".format(float(self.total_turns) / self.num_dialogs, self.max_len))
+        print(float(self.kb_turns) / self.total_turns)
+        print(self.kb_ratio_sum / self.num_dialogs)
+
+
+class JsonlWriter(object):
+    """
+    Write each dialog as one JSON line as soon as it is generated, together with the TSV export of its
+    action-level trace.
+
+    :ivar stats: CorpusStats of the dialogs written so far
+    """
+
+    def __init__(self, json_path, txt_path=None):
+        """
+        :param json_path: the JSONL file. One dialog per line.
+        :param txt_path: the TSV file of (speaker, actions, utterance). None to skip it.
+        """
+        self.json_f = open(json_path, "wb")
+        self.txt_f = open(txt_path, "wb") if txt_path is not None else None
+        self.stats = CorpusStats()
+
+    @staticmethod
+    def write_meta(domain_spec, meta_path):
+        """
+        Write the domain specification once as a sidecar of the JSONL corpus.
+        """
+        with open(meta_path, "wb") as f:
+            f.write(to_bytes(json.dumps({'meta': domain_spec.to_dict()}, indent=2, ensure_ascii=False)))
+
+    @staticmethod
+    def write_txt(f, one_dialog):
+        """
+        :param f: a file opened in binary mode
+        :param one_dialog: a list of (speaker, actions, utt)
+        """
+        for one_utt in one_dialog:
+            if "kb_return" in str(one_utt) or "query" in str(one_utt):
+                continue
+            else:
+                f.write(to_bytes(one_utt[0] + "\t" + str(one_utt[1]) + "\t" + one_utt[2] + "\n"))
+        f.write(b"\n")
+
+    def write(self, dialog, one_dialog):
+        """
+        :param dialog: a list of turns packed by Generator.pack_msg
+        :param one_dialog: the action-level trace of the same dialog
+        """
+        self.json_f.write(to_bytes(json.dumps(dialog, ensure_ascii=False)) + b"\n")
+        if self.txt_f is not None:
+            self.write_txt(self.txt_f, one_dialog)
+        self.stats.add(dialog)
+
+    def close(self):
+        self.json_f.close()
+        if self.txt_f is not None:
+            self.txt_f.close()
+
+    @staticmethod
+    def concat(part_paths, output_path, remove=True):
+        """
+        Concatenate part files into one file and remove the parts, unless remove is False.
+        """
+        with open(output_path, "wb") as out_f:
+            for path in part_paths:
+                with open(path, "rb") as part_f:
+                    shutil.copyfileobj(part_f, out_f)
+                if remove:
+                    os.remove(path)
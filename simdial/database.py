@@ -1,5 +1,10 @@
 import numpy as np
 import logging
+import os
+from collections import OrderedDict
+
+# the number of set bits of every byte value
+_POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1).astype(np.uint8)
 
 
 class Database(object):
@@ -12,17 +17,36 @@ class Database(object):
     :ivar usr_modalities: the vocab size of each column : List
     :ivar usr_pdf: the PDF for each columns : 2D list
     :ivar num_rows: the number of entries
-    :ivar table: the content : 2D list [[] *num_rows]
-    :ivar indexes: for efficient SELECT : [{attribute_word -> corresponding rows}]
+    :ivar table: the content : 2D array (num_rows, num_usr_slots) of the smallest unsigned dtype that fits
+    :ivar indexes: for efficient SELECT : [2D uint8 array (modality, num_bytes)], row i of attribute_word m
+    is bit i of indexes[attr][m], packed by np.packbits
+    :ivar all_rows: the packed bitset with every row set
+    :ivar unique_rows: the distinct rows of table, used to sample user goals
+    :ivar cache_size: the max number of queries in the LRU query cache. 0 disables the cache.
+    :ivar query_cache: LRU cache of normalized query -> matched row index array
+    :ivar cache_hits: the number of queries served by the cache
+    :ivar cache_misses: the number of queries searched in the indexes while the cache is enabled
+    :ivar cache_evictions: the number of queries dropped from the cache
+    :ivar snapshot_path: the snapshot folder the arrays are memory-mapped from, None if sampled in memory
+    :ivar mmap_mode: the np.load mmap_mode of the snapshot arrays
     """
 
     logger = logging.getLogger(__name__)
 
-    def __init__(self, usr_dirichlet_priors, sys_dirichlet_priors, num_rows):
+    # the arrays of a snapshot that are memory-mapped from their own .npy file
+    SNAPSHOT_ARRAYS = ('table', 'sys_table', 'unique_rows', 'all_rows')
+
+    # the value of a select_many query that does not constrain the attribute
+    DONT_CARE = -1
+    # the max number of packed bytes (num_queries * num_bytes) select_many handles at the same time
+    BATCH_BYTES = 2**21
+
+    def __init__(self, usr_dirichlet_priors, sys_dirichlet_priors, num_rows, cache_size=0):
         """
         :param usr_dirichlet_priors: 2D list [[]_0, []_1, ... []_k] for each searchable attributes
         :param sys_dirichlet_priors: 2D llst for each entry (non-searchable attributes)
         :param num_rows: the number of row in the database
+        :param cache_size: the max number of queries kept in the LRU query cache. 0 disables it.
         """
         self.usr_dirichlet_priors = usr_dirichlet_priors
         self.sys_dirichlet_priors = sys_dirichlet_priors
@@ -39,40 +63,174 @@ class Database(object):
         self.num_rows = num_rows
 
         # begin to generate the table
-        usr_table, usr_index = self._gen_table(self.usr_pdf, self.usr_modalities, self.num_usr_slots, num_rows)
-        sys_table, sys_index = self._gen_table(self.sys_pdf, self.sys_modalities, self.num_sys_slots, num_rows)
+        usr_dtype = self._min_dtype(max(self.usr_modalities + [1]) - 1)
+        self.table = self._gen_table(self.usr_pdf, self.usr_modalities, num_rows, usr_dtype)
+        self.indexes = [self._build_index(self.table[:, a_id], m) for a_id, m in enumerate(self.usr_modalities)]
+        self.all_rows = np.packbits(np.ones(self.num_rows, dtype=np.bool_))
 
         # append the UID in the first column
-        sys_table.insert(0, range(self.num_rows))
+        sys_dtype = self._min_dtype(max(self.sys_modalities + [num_rows]) - 1)
+        self.sys_table = self._gen_table(self.sys_pdf, self.sys_modalities, num_rows, sys_dtype, num_uid=1)
+        self.sys_table[:, 0] = np.arange(num_rows)
+        self.unique_rows = None
+        self._update_unique_rows()
+        self.snapshot_path = None
+        self.mmap_mode = None
+        self._init_cache(cache_size)
 
-        self.table = np.array(usr_table).transpose()
-        self.indexes = usr_index
-        self.sys_table = np.array(sys_table).transpose()
+    def _init_cache(self, cache_size):
+        self.cache_size = cache_size
+        self.query_cache = OrderedDict()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cache_evictions = 0
+        self.num_queries = 0
+
+    def save(self, path):
+        """
+        Save the database as a snapshot folder of .npy files, which can be memory-mapped by Database.load.
+
+        :param path: the snapshot folder
+        """
+        if not os.path.exists(path):
+            os.makedirs(path)
+        for name in self.SNAPSHOT_ARRAYS:
+            np.save(os.path.join(path, name + ".npy"), getattr(self, name))
+        # a domain may have no slots of one side, which are saved as empty arrays
+        indexes = np.concatenate(self.indexes, axis=0) if self.indexes \
+            else np.zeros((0, len(self.all_rows)), dtype=np.uint8)
+        np.save(os.path.join(path, "indexes.npy"), indexes)
+        np.savez(os.path.join(path, "meta.npz"),
+                 num_rows=self.num_rows,
+                 usr_modalities=self.usr_modalities,
+                 sys_modalities=self.sys_modalities,
+                 usr_dirichlet_priors=self._concat(self.usr_dirichlet_priors),
+                 sys_dirichlet_priors=self._concat(self.sys_dirichlet_priors),
+                 usr_pdf=self._concat(self.usr_pdf),
+                 sys_pdf=self._concat(self.sys_pdf))
 
     @staticmethod
-    def _gen_table(pdf, modalities, num_cols, num_rows):
-        list_table = []
-        indexes = []
-        for idx in range(num_cols):
-            col = np.random.choice(range(modalities[idx]), p=pdf[idx], size=num_rows)
-            list_table.append(col)
-            # indexing
-            index = {}
-            for m_id in range(modalities[idx]):
-                matched_list = np.squeeze(np.argwhere(col == m_id)).tolist()
-                matched_list = set(matched_list) if type(matched_list) is list else {matched_list}
-                index[m_id] = matched_list
-            indexes.append(index)
-        return list_table, indexes
-
-    def sample_unique_row(self):
+    def _concat(arrays):
+        return np.concatenate(arrays) if len(arrays) > 0 else np.zeros(0)
+
+    @classmethod
+    def load(cls, path, mmap_mode='r', cache_size=0):
+        """
+        Reopen a snapshot saved by Database.save. With mmap_mode='r' the tables and indexes are memory-mapped,
+        so processes that load the same snapshot share the same pages.
+
+        :param path: the snapshot folder
+        :param mmap_mode: passed to np.load. None to read everything into memory.
+        :param cache_size: the size of the LRU query cache
+        :return: a Database
+        """
+        db = cls.__new__(cls)
+        meta = np.load(os.path.join(path, "meta.npz"))
+        db.num_rows = int(meta['num_rows'])
+        db.usr_modalities = meta['usr_modalities'].tolist()
+        db.sys_modalities = meta['sys_modalities'].tolist()
+        db.num_usr_slots = len(db.usr_modalities)
+        db.num_sys_slots = len(db.sys_modalities)
+
+        def split(name, modalities):
+            return np.split(meta[name], np.cumsum(modalities)[:-1]) if modalities else []
+
+        db.usr_dirichlet_priors = split('usr_dirichlet_priors', db.usr_modalities)
+        db.sys_dirichlet_priors = split('sys_dirichlet_priors', db.sys_modalities)
+        db.usr_pdf = split('usr_pdf', db.usr_modalities)
+        db.sys_pdf = split('sys_pdf', db.sys_modalities)
+        meta.close()
+
+        db.snapshot_path = path
+        db.mmap_mode = mmap_mode
+        db._load_arrays()
+        db._init_cache(cache_size)
+        return db
+
+    def _load_arrays(self):
+        for name in self.SNAPSHOT_ARRAYS:
+            setattr(self, name, np.load(os.path.join(self.snapshot_path, name + ".npy"), mmap_mode=self.mmap_mode))
+        indexes = np.load(os.path.join(self.snapshot_path, "indexes.npy"), mmap_mode=self.mmap_mode)
+        self.indexes = np.split(indexes, np.cumsum(self.usr_modalities)[:-1]) if self.usr_modalities else []
+
+    def __getstate__(self):
+        # a snapshot is pickled by its path (e.g. to worker processes), which then map the same pages
+        state = self.__dict__.copy()
+        if self.snapshot_path is not None:
+            for name in self.SNAPSHOT_ARRAYS + ('indexes',):
+                state.pop(name)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.snapshot_path is not None:
+            self._load_arrays()
+
+    def _update_unique_rows(self):
+        """
+        Rebuild the distinct rows of the searchable table. It must be called whenever table changes.
         """
+        if 0 < self.num_usr_slots and np.prod([float(m) for m in self.usr_modalities]) < 2**62:
+            # encode each row as one mixed radix integer, so that np.unique runs on a 1D array.
+            # The first column is the most significant digit, which keeps the lexicographic row order.
+            strides = np.cumprod([1] + self.usr_modalities[:0:-1])[::-1].astype(np.int64)
+            codes = np.unique(self.table.dot(strides))
+            rows = np.empty((len(codes), self.num_usr_slots), dtype=self.table.dtype)
+            for a_id, stride in enumerate(strides):
+                rows[:, a_id] = codes // stride
+                codes = codes % stride
+            self.unique_rows = rows
+        else:
+            self.unique_rows = np.unique(self.table, axis=0)
+
+    @staticmethod
+    def _min_dtype(max_value):
+        """
+        :return: the smallest unsigned integer dtype that can hold max_value
+        """
+        for dtype in (np.uint8, np.uint16, np.uint32):
+            if max_value <= np.iinfo(dtype).max:
+                return dtype
+        return np.int64
+
+    @staticmethod
+    def _gen_table(pdf, modalities, num_rows, dtype, num_uid=0, chunk_size=2**20):
+        """
+        Sample each column from its PDF in chunks, directly into a compact table.
+
+        :param num_uid: the number of leading columns left for the caller to fill
+        :return: 2D array (num_rows, num_uid + len(modalities))
+        """
+        table = np.empty((num_rows, num_uid + len(modalities)), dtype=dtype)
+        for idx in range(len(modalities)):
+            for start in range(0, num_rows, chunk_size):
+                size = min(chunk_size, num_rows - start)
+                table[start:start+size, num_uid+idx] = np.random.choice(modalities[idx], p=pdf[idx], size=size)
+        return table
+
+    @staticmethod
+    def _build_index(col, modality):
+        """
+        Build the packed bitsets of one column in 8 vectorized scatter passes, one per bit position. Each pass
+        touches every byte once, so the cost is O(num_rows) regardless of the modality.
+
+        :param col: 1D array of attribute_word ids
+        :return: 2D uint8 array (modality, num_bytes), row m is the packed bitset of the rows equal to m
+        """
+        num_bytes = (len(col) + 7) // 8
+        index = np.zeros((modality, num_bytes), dtype=np.uint8)
+        for bit in range(8):
+            words = col[bit::8]
+            index[words, np.arange(len(words))] |= np.uint8(128 >> bit)
+        return index
+
+    def sample_unique_row(self, rng=None):
+        """
+        :param rng: np.random or a RandomPool. None for np.random.
         :return: a unique row in the searchable table
         """
-        unique_rows = np.unique(self.table, axis=0)
-        idxes = range(len(unique_rows))
-        np.random.shuffle(idxes)
-        return unique_rows[idxes[0]]
+        rng = np.random if rng is None else rng
+        return self.unique_rows[rng.randint(0, len(self.unique_rows))]
 
     def select(self, query, return_index=False):
         """
@@ -80,25 +238,183 @@ class Database(object):
         
         :param query: 1D [] equal to the number of attributes, None means don't care
         :param return_index: if return the db index
-        :return return a list system_entries and (optional)index that satisfy all constrains
+        :return return a list system_entries and (optional)index array that satisfy all constrains
         
         """
-        valid_idx = set(range(self.num_rows))
-        for q, a_id in zip(query, range(self.num_usr_slots)):
-            if q:
-                valid_idx -= self.indexes[a_id][q]
-                if len(valid_idx) == 0:
-                    break
-        valid_idx = list(valid_idx)
+        self.num_queries += 1
+        valid_idx = self._match_index(query)
         if return_index:
             return self.sys_table[valid_idx, :], valid_idx
         else:
             return self.sys_table[valid_idx, :]
 
+    def _query_key(self, query):
+        """
+        :return: the normalized query tuple. Attributes that are not constrained become None.
+        """
+        return tuple(q if q else None for q, a_id in zip(query, range(self.num_usr_slots)))
+
+    def _query_bits(self, query):
+        """
+        :return: the packed bitset of the rows that satisfy the query
+        """
+        valid = np.array(self.all_rows)
+        for q, a_id in zip(query, range(self.num_usr_slots)):
+            if q:
+                # AND NOT the rows of this attribute_word
+                valid &= ~self.indexes[a_id][q]
+                if not valid.any():
+                    break
+        return valid
+
+    def _search(self, query):
+        """
+        :return: the sorted row index array that satisfies the query, computed from the bitset indexes
+        """
+        return np.flatnonzero(np.unpackbits(self._query_bits(query))[:self.num_rows])
+
+    def count(self, query):
+        """
+        :param query: 1D [] equal to the number of attributes, None means don't care
+        :return: the number of entries that satisfy the query
+        """
+        self.num_queries += 1
+        if self.cache_size > 0:
+            return len(self._match_index(query))
+        return int(_POPCOUNT[self._query_bits(query)].sum())
+
+    def sample_match(self, query, rng=None):
+        """
+        Sample one entry that satisfies the query uniformly, straight from the indexes without copying the
+        matched entries out of sys_table. With the cache enabled, the matched row ids are cached as in select.
+
+        :param query: 1D [] equal to the number of attributes, None means don't care
+        :param rng: np.random or a RandomPool. None for np.random.
+        :return: the row id of the entry, None if nothing satisfies the query
+        """
+        rng = np.random if rng is None else rng
+        self.num_queries += 1
+        if self.cache_size > 0:
+            # the cached row ids are sorted, so the same rank picks the same row as the bitset path
+            valid_idx = self._match_index(query)
+            if len(valid_idx) == 0:
+                return None
+            return int(valid_idx[rng.randint(0, len(valid_idx))])
+
+        valid = self._query_bits(query)
+        num_match = int(_POPCOUNT[valid].sum())
+        if num_match == 0:
+            return None
+        rank = rng.randint(0, num_match)
+        return int(self._nth_bits(valid[None, :], np.array([rank]))[0])
+
+    def _match_index(self, query):
+        """
+        :return: the row index array that satisfies the query, served from the LRU cache if enabled
+        """
+        if self.cache_size <= 0:
+            return self._search(query)
+
+        key = self._query_key(query)
+        valid_idx = self.query_cache.pop(key, None)
+        if valid_idx is not None:
+            self.cache_hits += 1
+        else:
+            self.cache_misses += 1
+            valid_idx = self._search(key)
+            valid_idx.flags.writeable = False
+            if len(self.query_cache) >= self.cache_size:
+                self.query_cache.popitem(last=False)
+                self.cache_evictions += 1
+        self.query_cache[key] = valid_idx
+        return valid_idx
+
+    def select_many(self, queries, mode='count', rng=None):
+        """
+        Filter the database entries for many queries in one vectorized pass over the indexes. Each query
+        matches the same rows as select.
+
+        :param queries: 2D [] (num_queries, num_usr_slots). DONT_CARE or None means don't care
+        :param mode: 'mask' for a bool array (num_queries, num_rows) of the matched rows, 'count' for the
+        number of matched rows, 'sample' for one random matched row id (-1 if nothing matches) of each query
+        :param rng: np.random or a RandomPool for the 'sample' mode. None for np.random.
+        :return: an array with one row or one value per query
+        """
+        queries = np.asarray(queries)
+        if queries.dtype == object:
+            queries = np.where(np.equal(queries, None), self.DONT_CARE, queries)
+        queries = queries.astype(np.int64).reshape(-1, self.num_usr_slots)
+        self.num_queries += len(queries)
+
+        if mode not in ('mask', 'count', 'sample'):
+            raise ValueError("Unknown select_many mode %s" % mode)
+
+        results = []
+        batch_size = max(1, self.BATCH_BYTES // max(1, len(self.all_rows)))
+        for start in range(0, len(queries), batch_size):
+            batch = queries[start:start+batch_size]
+            valid = np.tile(self.all_rows, (len(batch), 1))
+            for a_id in range(self.num_usr_slots):
+                values = batch[:, a_id]
+                # same as select, 0 does not constrain the attribute either
+                active = values > 0
+                if active.any():
+                    valid[active] &= ~self.indexes[a_id][values[active]]
+
+            if mode == 'mask':
+                results.append(np.unpackbits(valid, axis=1)[:, :self.num_rows].astype(np.bool_))
+            elif mode == 'count':
+                results.append(_POPCOUNT[valid].sum(axis=1, dtype=np.int64))
+            else:
+                results.append(self._sample_bits(valid, rng=rng))
+
+        if len(results) == 0:
+            return np.zeros((0, self.num_rows), dtype=np.bool_) if mode == 'mask' else np.zeros(0, dtype=np.int64)
+        return np.concatenate(results)
+
+    @classmethod
+    def _sample_bits(cls, valid, rng=None):
+        """
+        Pick one random set bit in each packed bitset without unpacking it.
+
+        :param valid: 2D uint8 array (num_sets, num_bytes)
+        :param rng: np.random or a RandomPool. None for np.random.
+        :return: the position of the picked bit of each set, -1 if the set is empty
+        """
+        rng = np.random if rng is None else rng
+        counts = _POPCOUNT[valid].sum(axis=1, dtype=np.int64)
+        rank = np.floor(rng.rand(len(valid)) * counts).astype(np.int64)
+        return np.where(counts > 0, cls._nth_bits(valid, rank), -1)
+
+    @staticmethod
+    def _nth_bits(valid, rank):
+        """
+        :param valid: 2D uint8 array (num_sets, num_bytes) of packed bitsets
+        :param rank: the 0-based rank of the wanted set bit in each bitset
+        :return: the position of the rank-th set bit in each bitset
+        """
+        counts_per_byte = _POPCOUNT[valid]
+        cum_counts = np.cumsum(counts_per_byte, axis=1, dtype=np.int64)
+
+        # the byte that contains the rank-th set bit, then the bit inside this byte
+        rows = np.arange(len(valid))
+        byte_pos = np.minimum((cum_counts <= rank[:, None]).sum(axis=1), valid.shape[1] - 1)
+        rank = rank - (cum_counts[rows, byte_pos] - counts_per_byte[rows, byte_pos])
+        bits = np.unpackbits(valid[rows, byte_pos][:, None], axis=1)
+        bit_pos = (np.cumsum(bits, axis=1) <= rank[:, None]).sum(axis=1)
+        return byte_pos * 8 + bit_pos
+
+    def cache_info(self):
+        """
+        :return: a dict of the query cache counters and of the number of queries served
+        """
+        return {'size': len(self.query_cache), 'max_size': self.cache_size, 'hits': self.cache_hits,
+                'misses': self.cache_misses, 'evictions': self.cache_evictions, 'queries': self.num_queries}
+
     def pprint(self):
         """
         print statistics of the database in a beautiful format. 
         """
 
         self.logger.info("DB contains %d rows (%d unique ones), with %d attributes"
-                         % (self.num_rows, len(np.unique(self.table, axis=0)), self.num_usr_slots))
+                         % (self.num_rows, len(self.unique_rows), self.num_usr_slots))
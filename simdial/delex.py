@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+# author: Tiancheng Zhao
+"""
+The delexicalized corpus stores every turn as integer ids instead of surface strings and state dicts. A dialog is
+one JSON line of turns
+
+    SYS turn    [0, actions, choices]
+    USR turn    [1, actions, choices, [hesitation_pos, filler_id, restart_len, asr_mask], conf]
+
+where an action is [act_id, parameter, ...] with slot ids and value ids (-1 for None), choices are the template
+ids picked by the NLG in order, and asr_mask has bit i set if the ASR noise changed the i-th user action. The
+id vocabularies are written once in a .meta.json sidecar. DelexReader rebuilds the same turns as
+Generator.pack_msg, including the exact utterances and system states, from the domain the corpus was
+generated with (e.g. its artifact).
+"""
+from simdial.agent.core import Action, SystemAct, UserAct, BaseSysSlot, BaseUsrSlot
+from simdial.agent.system import System
+from simdial.agent.nlg import SysNlg, UserNlg
+from simdial.channel import InteractionNoise
+from simdial.corpus import JsonlWriter, to_bytes
+from simdial.rng import ReplayPool
+import json
+
+DELEX_VERSION = 1
+
+
+def _constants(cls):
+    """
+    :return: the sorted values of the upper case string attributes of a class
+    """
+    return sorted(v for k, v in vars(cls).items() if k.isupper() and isinstance(v, str))
+
+
+class DelexCodec(object):
+    """
+    Map actions to nested lists of integer ids and back.
+
+    :ivar sys_acts: the system act of each act id
+    :ivar usr_acts: the user act of each act id
+    :ivar slots: the slot name of each slot id. Domain slots come first in domain order.
+    """
+
+    SYS = 0
+    USR = 1
+    NONE = -1
+    FLAG_SLOTS = (BaseUsrSlot.AGAIN, BaseUsrSlot.SELF_CORRECT)
+
+    # the parameters of these acts are not a list of (slot, value) pairs
+    LAYOUTS = {(SYS, SystemAct.QUERY): ('pairs', 'slots'),
+               (SYS, SystemAct.INFORM): ('values', 'goals'),
+               (USR, UserAct.KB_RETURN): ('pairs', 'values')}
+
+    def __init__(self, domain):
+        self.sys_acts = _constants(SystemAct)
+        self.usr_acts = _constants(UserAct)
+        self.slots = [s.name for s in domain.usr_slots] + [s.name for s in domain.sys_slots]
+        self.slots.extend(s for s in _constants(BaseSysSlot) + _constants(BaseUsrSlot) if s not in self.slots)
+
+        self.act_ids = {self.SYS: {a: i for i, a in enumerate(self.sys_acts)},
+                        self.USR: {a: i for i, a in enumerate(self.usr_acts)}}
+        self.slot_ids = {s: i for i, s in enumerate(self.slots)}
+
+    def to_dict(self):
+        return {'version': DELEX_VERSION,
+                'sys_acts': self.sys_acts,
+                'usr_acts': self.usr_acts,
+                'slots': self.slots,
+                'fillers': InteractionNoise.FILLERS}
+
+    def _value(self, value):
+        return self.NONE if value is None else int(value)
+
+    def _pair(self, slot_id, code):
+        name = self.slots[slot_id]
+        if code == self.NONE:
+            return name, None
+        return name, True if name in self.FLAG_SLOTS else code
+
+    def layout(self, speaker, act, p_id):
+        """
+        :return: how the p_id-th parameter of the act is encoded. 'pair' for a (slot, value) pair.
+        """
+        layouts = self.LAYOUTS.get((speaker, act))
+        # a rephrased action carries one more (AGAIN, True) pair
+        if layouts is None or p_id >= len(layouts):
+            return 'pair'
+        return layouts[p_id]
+
+    def _sorted_items(self, d):
+        # the dicts are rebuilt in domain slot order, the order in which the agents build them
+        return sorted((self.slot_ids[k], v) for k, v in d.items())
+
+    def _encode_parameter(self, layout, param):
+        if layout == 'pair':
+            return [self.slot_ids[param[0]], self._value(param[1])]
+        elif layout == 'pairs':
+            return [[self.slot_ids[k], self._value(v)] for k, v in param]
+        elif layout == 'slots':
+            return [self.slot_ids[k] for k in param]
+        elif layout == 'values':
+            return [[s_id, self._value(v)] for s_id, v in self._sorted_items(param)]
+        else:
+            return [[s_id, self._value(v), self._value(e_v)] for s_id, (v, e_v) in self._sorted_items(param)]
+
+    def _decode_parameter(self, layout, code):
+        if layout == 'pair':
+            return self._pair(*code)
+        elif layout == 'pairs':
+            return [self._pair(*c) for c in code]
+        elif layout == 'slots':
+            return [self.slots[s_id] for s_id in code]
+        elif layout == 'values':
+            return dict(self._pair(*c) for c in code)
+        else:
+            return dict((self.slots[s_id], (None if v == self.NONE else v, None if e_v == self.NONE else e_v))
+                        for s_id, v, e_v in code)
+
+    def encode_actions(self, speaker, actions):
+        """
+        :param speaker: SYS or USR
+        :param actions: a list of Action
+        :return: a list of [act_id, parameter, ...]
+        """
+        codes = []
+        for a in actions:
+            code = [self.act_ids[speaker][a.act]]
+            for p_id, param in enumerate(a.parameters):
+                code.append(self._encode_parameter(self.layout(speaker, a.act, p_id), param))
+            codes.append(code)
+        return codes
+
+    def decode_actions(self, speaker, codes):
+        """
+        :return: the list of Action encoded by encode_actions
+        """
+        acts = self.sys_acts if speaker == self.SYS else self.usr_acts
+        actions = []
+        for code in codes:
+            act = acts[code[0]]
+            actions.append(Action(act, [self._decode_parameter(self.layout(speaker, act, p_id), c)
+                                        for p_id, c in enumerate(code[1:])]))
+        return actions
+
+    def encode_sys_turn(self, sys_actions, choices):
+        return [self.SYS, self.encode_actions(self.SYS, sys_actions), choices]
+
+    def encode_usr_turn(self, usr_actions, noisy_actions, conf, choices, word_noise):
+        """
+        :param usr_actions: the clean user actions
+        :param noisy_actions: the same actions after the action channel
+        :param conf: the ASR confidence
+        :param choices: the template ids picked by the user NLG
+        :param word_noise: (hesitation_pos, filler_id, restart_len) from the word channel
+        """
+        asr_mask = 0
+        for i, (a, noisy_a) in enumerate(zip(usr_actions, noisy_actions)):
+            if a.act != noisy_a.act or a.parameters[0:1] != noisy_a.parameters[0:1]:
+                asr_mask |= 1 << i
+        return [self.USR, self.encode_actions(self.USR, noisy_actions), choices, list(word_noise) + [asr_mask],
+                float(conf)]
+
+
+class DelexWriter(JsonlWriter):
+    """
+    Write each dialog as one JSON line of its delexicalized turns, together with the TSV export of its
+    action-level trace.
+    """
+
+    @staticmethod
+    def write_meta(domain_spec, meta_path, codec):
+        """
+        Write the domain specification and the id vocabularies of the codec once as a sidecar of the corpus.
+        """
+        with open(meta_path, "wb") as f:
+            f.write(to_bytes(json.dumps({'meta': domain_spec.to_dict(), 'delex': codec.to_dict()},
+                                        indent=2, ensure_ascii=False)))
+
+    def write(self, dialog, one_dialog, delex_dialog):
+        """
+        :param dialog: a list of turns packed by Generator.pack_msg, used for the stats
+        :param one_dialog: the action-level trace of the same dialog
+        :param delex_dialog: the delexicalized turns of the same dialog
+        """
+        self.json_f.write(to_bytes(json.dumps(delex_dialog, separators=(',', ':'))) + b"\n")
+        if self.txt_f is not None:
+            self.write_txt(self.txt_f, one_dialog)
+        self.stats.add(dialog)
+
+
+class DelexReader(object):
+    """
+    Rebuild the packed turns of a delexicalized corpus.
+
+    :ivar domain: the domain the corpus was generated with
+    :ivar codec: the DelexCodec of the domain
+    """
+
+    def __init__(self, domain, pack_msg, meta_path=None):
+        """
+        :param domain: the domain the corpus was generated with, e.g. loaded from its artifact
+        :param pack_msg: the function that packs a turn, i.e. Generator.pack_msg
+        :param meta_path: the .meta.json sidecar to check the id vocabularies against. None to skip it.
+        :raise ValueError: if the vocabularies of the sidecar do not match the domain
+        """
+        self.domain = domain
+        self.pack_msg = pack_msg
+        self.codec = DelexCodec(domain)
+        if meta_path is not None:
+            with open(meta_path, "rb") as f:
+                delex_meta = json.loads(f.read().decode('utf-8'))['delex']
+            if delex_meta != json.loads(json.dumps(self.codec.to_dict())):
+                raise ValueError("Delexicalized corpus %s does not match domain %s" % (meta_path, domain.name))
+
+        self.replay = ReplayPool()
+        self.sys_nlg = SysNlg(domain, None, rng=self.replay)
+        self.usr_nlg = UserNlg(domain, None, rng=self.replay)
+
+    def _generate(self, nlg, actions, choices, **kwargs):
+        self.replay.load(choices)
+        output = nlg.generate_sent(actions, **kwargs)
+        if not self.replay.is_done():
+            raise ValueError("Template choices do not match the actions")
+        return output
+
+    def rebuild(self, delex_dialog, with_state=True):
+        """
+        :param delex_dialog: the delexicalized turns of a dialog
+        :param with_state: True to rebuild the system states by replaying the system
+        :return: the dialog as a list of packed turns, as Generator.gen returns it
+        """
+        codec = self.codec
+        sys = System(self.domain, None) if with_state else None
+        noisy_usr_as = []
+        conf = 1.0
+        dialog = []
+        for turn in delex_dialog:
+            if turn[0] == codec.SYS:
+                sys_as = codec.decode_actions(codec.SYS, turn[1])
+                sys_utt, sys_str_as = self._generate(self.sys_nlg, sys_as, turn[2], domain=self.domain)
+                if sys is None:
+                    dialog.append(self.pack_msg("SYS", sys_utt, actions=sys_str_as, domain=self.domain.name))
+                    continue
+                _, _, replay_as, sys_s = sys.step(noisy_usr_as, conf)
+                if replay_as != sys_as:
+                    raise ValueError("The system replay diverges from the stored system actions")
+                dialog.append(self.pack_msg("SYS", sys_utt, actions=sys_str_as, domain=self.domain.name,
+                                            state=sys_s))
+            else:
+                noisy_usr_as = codec.decode_actions(codec.USR, turn[1])
+                usr_utt = self._generate(self.usr_nlg, noisy_usr_as, turn[2])
+                noisy_usr_utt = InteractionNoise.apply_word_noise(usr_utt, turn[3][0:3])
+                conf = turn[4]
+                dialog.append(self.pack_msg("USR", noisy_usr_utt, actions=noisy_usr_as, conf=conf,
+                                            domain=self.domain.name))
+        return dialog
+
+    def read(self, path, with_state=True):
+        """
+        :param path: a delexicalized JSONL corpus
+        :return: a generator of the rebuilt dialogs
+        """
+        with open(path, "rb") as f:
+            for line in f:
+                yield self.rebuild(json.loads(line), with_state=with_state)
@@ -3,6 +3,7 @@
 from simdial.database import Database
 import numpy as np
 from simdial.agent.core import BaseSysSlot
+from simdial.agent.nlg import Lexicon
 import logging
 
 
@@ -44,30 +45,31 @@ class Slot(object):
         self.informs = []
         self.yn_questions = {}
 
-    def sample_request(self):
+    def sample_request(self, rng=None):
         if self.requests:
-            return np.random.choice(self.requests)
+            return (np.random if rng is None else rng).choice(self.requests)
         else:
             raise ValueError("Sample from empty request_utt pool")
 
-    def sample_inform(self):
+    def sample_inform(self, rng=None):
         if self.informs:
-            return np.random.choice(self.informs)
+            return (np.random if rng is None else rng).choice(self.informs)
         else:
             raise ValueError("Sample from empty inform_utt pool")
 
-    def sample_yn_question(self, expect_val):
+    def sample_yn_question(self, expect_val, rng=None):
         questions = self.yn_questions.get(expect_val, [])
         if questions:
-            return np.random.choice(questions)
+            return (np.random if rng is None else rng).choice(questions)
         else:
             raise ValueError("Sample from empty yn_questions pool")
 
-    def sample_different(self, value):
+    def sample_different(self, value, rng=None):
+        rng = np.random if rng is None else rng
         if value is None:
-            return np.random.randint(0, self.dim)
+            return rng.randint(0, self.dim)
         else:
-            return np.random.choice([None] + [i for i in range(self.dim) if i != value])
+            return rng.choice([None] + [i for i in range(self.dim) if i != value])
 
 
 class Domain(object):
@@ -79,19 +81,26 @@ class Domain(object):
     that contains slot_name, slot_description, dimension
     :ivar usr_slots: a list of slots that users can impose a constrains. Each slot is a dictionary 
     that contains slot_name, slot_description, dimension
+    :ivar usr_slot_map: slot_name -> (slot, index) of usr_slots
+    :ivar sys_slot_map: slot_name -> (slot, index) of sys_slots
+    :ivar lexicon: the pre-rendered surface strings of the slots
     """
 
     logger = logging.getLogger(__name__)
 
-    def __init__(self, domain_spec):
+    def __init__(self, domain_spec, db_cache_size=0, db_snapshot=None):
         """
         :param domain_spec: an implementation of DomainSpec
+        :param db_cache_size: the size of the LRU query cache of the database. 0 disables it.
+        :param db_snapshot: a folder saved by Database.save to reuse instead of sampling a new database
         """
         self.name = domain_spec.name
         self.greet = domain_spec.greet
         self.usr_slots = [Slot("#"+name, desc, vocab) for name, desc, vocab in domain_spec.usr_slots]
         self.sys_slots = [Slot("#"+name, desc, vocab) for name, desc, vocab in domain_spec.sys_slots]
         self.sys_slots.insert(0, Slot(BaseSysSlot.DEFAULT, "", [str(i) for i in range(domain_spec.db_size)]))
+        self.usr_slot_map = {s.name: (s, s_id) for s_id, s in enumerate(self.usr_slots)}
+        self.sys_slot_map = {s.name: (s, s_id) for s_id, s in enumerate(self.sys_slots)}
 
         for slot_name, slot_nlg in domain_spec.nlg_spec.items():
             slot_name = "#"+slot_name
@@ -102,11 +111,20 @@ class Domain(object):
                 slot.yn_questions = slot_nlg.get('yn_question', {})
             else:
                 raise Exception("Fail to align %s nlg spec with the rest of domain" % slot_name)
+        self.lexicon = Lexicon(self.usr_slots, self.sys_slots)
         usr_slot_priors = [np.ones(s.dim) for s in self.usr_slots]  # we assume a uniform prior
         # we left out DEFAULT from prior since it'e KEY
         sys_slot_priors = [np.ones(s.dim) for s in self.sys_slots[1:]]
 
-        self.db = Database(usr_slot_priors, sys_slot_priors, num_rows=domain_spec.db_size)
+        if db_snapshot is None:
+            self.db = Database(usr_slot_priors, sys_slot_priors, num_rows=domain_spec.db_size,
+                               cache_size=db_cache_size)
+        else:
+            self.db = Database.load(db_snapshot, cache_size=db_cache_size)
+            if self.db.usr_modalities != [s.dim for s in self.usr_slots] \
+                    or self.db.sys_modalities != [s.dim for s in self.sys_slots[1:]] \
+                    or self.db.num_rows != domain_spec.db_size:
+                raise ValueError("DB snapshot %s does not match domain %s" % (db_snapshot, self.name))
         self.db.pprint()
 
     def get_usr_slot(self, slot_name, return_idx=False):
@@ -115,13 +133,10 @@ class Domain(object):
         :param return_idx: True/False to return slot index
         :return: slot, (index) or None if it's not user slot
         """
-        for s_id, s in enumerate(self.usr_slots):
-            if s.name == slot_name:
-                if return_idx:
-                    return s, s_id
-                else:
-                    return s
-        return None
+        found = self.usr_slot_map.get(slot_name)
+        if found is None:
+            return None
+        return found if return_idx else found[0]
 
     def get_sys_slot(self, slot_name, return_idx=False):
         """
@@ -129,17 +144,14 @@ class Domain(object):
         :param return_idx: True/False to return slot index
         :return: slot, (index) or None if it's not system slot
         """
-        for s_id, s in enumerate(self.sys_slots):
-            if s.name == slot_name:
-                if return_idx:
-                    return s, s_id
-                else:
-                    return s
-        return None
+        found = self.sys_slot_map.get(slot_name)
+        if found is None:
+            return None
+        return found if return_idx else found[0]
 
     def is_usr_slot(self, query_name):
         """
         :param query_name: a slot name
         :return: True if slot_name is user slot, False o/w
         """
-        return query_name in [s.name for s in self.usr_slots]
+        return query_name in self.usr_slot_map
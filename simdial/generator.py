@@ -7,13 +7,153 @@ from simdial.channel import ActionChannel, WordChannel
 from simdial.agent.nlg import SysNlg, UserNlg
 from simdial.complexity import Complexity
 from simdial.domain import Domain
+from simdial.corpus import CorpusStats, JsonlWriter
+from simdial.artifact import load_domain, spec_hash, ARTIFACT_VERSION
+from simdial.checkpoint import Checkpoint
+from simdial.segments import CorpusManifest
+from simdial.rng import RandomPool, RecordingPool
+from simdial.delex import DelexCodec, DelexWriter
+from simdial.columnar import ColumnarWriter
+from simdial.profiler import NullProfiler, Profiler
+from simdial.tracing import recorder
 import progressbar
 import json
 import numpy as np
+import multiprocessing
+import signal
+import gc
+import shutil
+import glob
+import itertools
 import sys
 import os
 import re
 import codecs
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+
+# an untimed wait on a multiprocessing result cannot be interrupted by Ctrl-C on Python 2
+_POOL_TIMEOUT = 2**31
+
+
+def _ignore_sigint():
+    """
+    Pool initializer. Ctrl-C reaches the whole process group, so the workers ignore it and leave it to the
+    parent, which terminates them.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _map_shards(func, shards):
+    """
+    Run func on every shard in its own worker process.
+
+    :return: the results in shard order
+    """
+    pool = multiprocessing.Pool(len(shards), _ignore_sigint)
+    try:
+        results = pool.map_async(func, shards, chunksize=1).get(_POOL_TIMEOUT)
+    except BaseException:
+        pool.terminate()
+        pool.join()
+        raise
+    pool.close()
+    pool.join()
+    return results
+
+
+def _dump_dialogs(dialogs, outputs):
+    """
+    Pickle the dialogs of a worker shard into one string, so multiprocessing sends it back as a single
+    object. The cyclic GC is paused, since the dialogs are millions of small containers that would
+    otherwise trigger a full collection again and again.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return pickle.dumps((dialogs, outputs), pickle.HIGHEST_PROTOCOL)
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _load_dialogs(data):
+    """
+    :return: the dialogs and outputs pickled by _dump_dialogs, also unpickled with the cyclic GC paused
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return pickle.loads(data)
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _shard_generator(profile):
+    """
+    :param profile: None, or (snapshot_every, snapshot_path) of the Profiler of the shard
+    """
+    return Generator() if profile is None else Generator(profiler=Profiler(*profile))
+
+
+def _shard_profile(generator):
+    return generator.profiler.to_dict() if generator.profiler.enabled else None
+
+
+def _gen_shard(args):
+    """
+    Generate one shard of dialogs in a worker process. It is defined at module level so that it can be
+    pickled by multiprocessing.
+
+    :param args: (domain, complexity, num_sess, seed, profile)
+    :return: the dialogs and outputs of this shard encoded by _dump_dialogs, and the records of its profiler
+    (None if disabled)
+    """
+    domain, complexity, num_sess, seed, profile = args
+    np.random.seed(seed)
+    generator = _shard_generator(profile)
+    dialogs, outputs = generator.gen(domain, complexity, num_sess=num_sess)
+    return _dump_dialogs(dialogs, outputs), _shard_profile(generator)
+
+
+def _write_shard(args):
+    """
+    Generate one shard of dialogs in a worker process and stream them to its own part files.
+
+    :param args: (domain, complexity, num_sess, seed, json_path, txt_path, delex, columnar, profile)
+    :return: CorpusStats of this shard, and the records of its profiler (None if disabled)
+    """
+    domain, complexity, num_sess, seed, json_path, txt_path, delex, columnar, profile = args
+    np.random.seed(seed)
+    generator = _shard_generator(profile)
+    stats = generator.gen_stream(domain, complexity, num_sess, json_path, txt_path, delex=delex,
+                                 columnar=columnar)
+    return stats, _shard_profile(generator)
+
+
+def _write_checkpoint_shard(args):
+    """
+    :param args: (shard_id, the args of _write_shard)
+    :return: shard_id and the result of _write_shard
+    """
+    shard_id, shard_args = args
+    return shard_id, _write_shard(shard_args)
+
+
+def _replace(src, dst):
+    """
+    Rename the file or folder src to dst, removing what dst holds.
+    """
+    if os.path.isdir(dst):
+        shutil.rmtree(dst)
+    elif os.path.exists(dst):
+        os.remove(dst)
+    os.rename(src, dst)
+
 
 class Generator(object):
     """
@@ -22,8 +162,28 @@ class Generator(object):
     level. 
     
     The required input is a domain specification dictionary + a configuration dict.
+
+    :ivar profiler: a Profiler that times the stages of the generation, or a NullProfiler
     """
 
+    def __init__(self, profiler=None):
+        """
+        :param profiler: a simdial.profiler.Profiler to instrument the generation. None disables it.
+        """
+        self.profiler = NullProfiler() if profiler is None else profiler
+
+    def _shard_profile(self, shard_id, num_shards):
+        """
+        :return: the profiler settings of a worker shard, None if profiling is disabled. A single shard
+        writes its snapshots to the snapshot file of the generator.
+        """
+        if not self.profiler.enabled:
+            return None
+        snapshot_path = self.profiler.snapshot_path
+        if snapshot_path is not None and num_shards > 1:
+            snapshot_path = "%s.part%d" % (snapshot_path, shard_id)
+        return self.profiler.snapshot_every, snapshot_path
+
     @staticmethod
     def pack_msg(speaker, utt, **kwargs):
         resp = {k: v for k, v in kwargs.items()}
@@ -68,111 +228,422 @@ class Generator(object):
         
         :param dialogs: A list of dialogs generated.
         """
-        print("%d dialogs" % len(dialogs))
-        all_lens = [len(d) for d in dialogs]
-        print("Avg len {} Max Len {}".format(np.mean(all_lens), np.max(all_lens)))
-
-        total_cnt = 0.
-        kb_cnt = 0.
-        ratio = []
+        stats = CorpusStats()
         for d in dialogs:
-            local_cnt = 0.
-            for t in d:
-                total_cnt +=1
-                if 'QUERY' in t['utt']:
-                    kb_cnt += 1
-                    local_cnt += 1
-            ratio.append(local_cnt/len(d))
-        print(kb_cnt/total_cnt)
-        print(np.mean(ratio))
-
-    def gen(self, domain, complexity, num_sess=1):
+            stats.add(d)
+        stats.pprint()
+
+    @staticmethod
+    def shard_plan(num_sess, num_shards, seed=None):
+        """
+        Split the sessions into contiguous shards, each with its own RNG seed.
+
+        :param num_sess: the total number of dialogs
+        :param num_shards: the number of shards
+        :param seed: the master seed. None means drawing the shard seeds from the global RNG.
+        :return: a list of (num_sess, seed) for each shard
+        """
+        num_shards = max(1, min(num_shards, num_sess))
+        sizes = [num_sess // num_shards + (1 if i < num_sess % num_shards else 0) for i in range(num_shards)]
+        rng = np.random if seed is None else np.random.RandomState(seed)
+        seeds = rng.randint(0, 2**31-1, size=num_shards).tolist()
+        return list(zip(sizes, seeds))
+
+    def gen(self, domain, complexity, num_sess=1, num_workers=1, seed=None):
         """
         Generate synthetic dialogs in the given domain. 
 
         :param domain: a domain specification dictionary
         :param complexity: an implmenetaiton of Complexity
         :param num_sess: how dialogs to generate
+        :param num_workers: the number of processes. The sessions are split into one shard per worker and
+        each shard runs with its own seed, user, system, channels and NLGs.
+        :param seed: the master seed of the shards. The output is deterministic given (seed, num_workers).
         :return: a list of dialogs. Each dialog is a list of turns.
         """
+        if num_workers > 1 or seed is not None:
+            plan = self.shard_plan(num_sess, num_workers, seed)
+            shards = [(domain, complexity, n, s, self._shard_profile(shard_id, len(plan)))
+                      for shard_id, (n, s) in enumerate(plan)]
+            if len(shards) > 1:
+                results = _map_shards(_gen_shard, shards)
+            else:
+                results = [_gen_shard(shards[0])]
+
+            dialogs, outputs = [], []
+            for data, shard_profile in results:
+                shard_dialogs, shard_outputs = _load_dialogs(data)
+                dialogs.extend(shard_dialogs)
+                outputs.extend(shard_outputs)
+                if shard_profile is not None:
+                    self.profiler.merge(shard_profile)
+            return dialogs, outputs
+
         dialogs = []
         outputs = []
-        states = []
-        action_channel = ActionChannel(domain, complexity)
-        word_channel = WordChannel(domain, complexity)
-
-        # natural language generators
-        sys_nlg = SysNlg(domain, complexity)
-        usr_nlg = UserNlg(domain, complexity)
-
-        # bar = progressbar.ProgressBar(max_value=num_sess)
-        for i in range(num_sess):
-            # bar.update(i)
-            usr = User(domain, complexity)
-            sys = System(domain, complexity)
-
-            # begin conversation
-            noisy_usr_as = []
-            dialog = []
-            conf = 1.0
-            one_dialog = []
-            one_state = []
-            while True:
-                # make a decision
-                sys_r, sys_t, sys_as, sys_s = sys.step(noisy_usr_as, conf)
-                sys_utt, sys_str_as = sys_nlg.generate_sent(sys_as, domain=domain)
-                dialog.append(self.pack_msg("SYS", sys_utt, actions=sys_str_as, domain=domain.name, state=sys_s))
-                one_dialog.append(("System", sys_as, sys_utt))
-                one_state.append(sys_s)
-
-                if sys_t:
-                    break
-
-                usr_r, usr_t, usr_as = usr.step(sys_as)
-
-                # passing through noise, nlg and noise!
-                noisy_usr_as, conf = action_channel.transmit2sys(usr_as)
-                usr_utt = usr_nlg.generate_sent(noisy_usr_as)
-                noisy_usr_utt = word_channel.transmit2sys(usr_utt)
-
-                one_dialog.append(("User", noisy_usr_as, noisy_usr_utt))
-                dialog.append(self.pack_msg("USR", noisy_usr_utt, actions=noisy_usr_as, conf=conf, domain=domain.name))
-
+        for dialog, one_dialog in self.iter_dialogs(domain, complexity, n=num_sess):
             dialogs.append(dialog)
             outputs.append(one_dialog)
-            states.append(one_state)
 
         return dialogs, outputs
 
-    def gen_corpus(self, name, domain_spec, complexity_spec, size):
+    def iter_dialogs(self, domain, complexity, n=None, delex=False):
+        """
+        Lazily generate synthetic dialogs one at a time, so that a consumer can pull them on demand.
+
+        :param domain: a domain specification dictionary
+        :param complexity: an implmenetaiton of Complexity
+        :param n: how many dialogs to generate. None to generate forever.
+        :param delex: True to also record the delexicalized turns of each dialog, see simdial.delex
+        :return: a generator of (dialog, one_dialog, (delex_dialog)). dialog is a list of turns and one_dialog
+        is the act-level trace [(speaker, actions, utt)] of the same dialog.
+        """
+        # one random pool is shared by all components and reseeded for every session
+        rng = RandomPool()
+        action_channel = ActionChannel(domain, complexity, rng=rng)
+        word_channel = WordChannel(domain, complexity, rng=rng)
+
+        # natural language generators. Their template choices are recorded for the delexicalized turns.
+        codec = DelexCodec(domain) if delex else None
+        nlg_rng = RecordingPool(rng) if delex else rng
+        sys_nlg = SysNlg(domain, complexity, rng=nlg_rng)
+        usr_nlg = UserNlg(domain, complexity, rng=nlg_rng)
+
+        sess_ids = itertools.count() if n is None else range(n)
+        for i in sess_ids:
+            rng.seed(np.random.randint(0, 2**31-1))
+            yield self._gen_session(domain, complexity, action_channel, word_channel, sys_nlg, usr_nlg, rng,
+                                    codec=codec)
+
+    def _gen_session(self, domain, complexity, action_channel, word_channel, sys_nlg, usr_nlg, rng=None,
+                     codec=None):
+        """
+        Simulate one conversation between a new user and a new system.
+
+        :param rng: the random pool shared with the channels and NLGs
+        :param codec: a DelexCodec to also return the delexicalized turns. The NLGs must draw from a
+        RecordingPool then.
+        :return: the dialog as a list of packed turns, its action-level trace [(speaker, actions, utt)] and
+        (the delexicalized turns)
+        """
+        prof = self.profiler
+        num_queries = domain.db.num_queries
+        recorder.start_dialog()
+        t = prof.clock()
+        usr = User(domain, complexity, rng=rng)
+        sys = System(domain, complexity)
+        t = prof.lap('session_init', t)
+
+        # begin conversation
+        noisy_usr_as = []
+        dialog = []
+        conf = 1.0
+        one_dialog = []
+        delex_dialog = []
+        while True:
+            # make a decision
+            sys_r, sys_t, sys_as, sys_s = sys.step(noisy_usr_as, conf)
+            t = prof.lap('system', t)
+            sys_utt, sys_str_as = sys_nlg.generate_sent(sys_as, domain=domain)
+            t = prof.lap('sys_nlg', t)
+            dialog.append(self.pack_msg("SYS", sys_utt, actions=sys_str_as, domain=domain.name, state=sys_s))
+            one_dialog.append(("System", sys_as, sys_utt))
+            if codec is not None:
+                delex_dialog.append(codec.encode_sys_turn(sys_as, sys_nlg.rng.drain()))
+            t = prof.lap('pack', t)
+
+            if sys_t:
+                break
+
+            usr_r, usr_t, usr_as = usr.step(sys_as)
+            t = prof.lap('user', t)
+
+            # passing through noise, nlg and noise!
+            noisy_usr_as, conf = action_channel.transmit2sys(usr_as)
+            t = prof.lap('action_channel', t)
+            usr_utt = usr_nlg.generate_sent(noisy_usr_as)
+            t = prof.lap('usr_nlg', t)
+            noisy_usr_utt, word_noise = word_channel.transmit2sys(usr_utt, return_noise=True)
+            t = prof.lap('word_channel', t)
+
+            one_dialog.append(("User", noisy_usr_as, noisy_usr_utt))
+            dialog.append(self.pack_msg("USR", noisy_usr_utt, actions=noisy_usr_as, conf=conf, domain=domain.name))
+            if codec is not None:
+                delex_dialog.append(codec.encode_usr_turn(usr_as, noisy_usr_as, conf, usr_nlg.rng.drain(),
+                                                          word_noise))
+            t = prof.lap('pack', t)
+
+        prof.end_dialog(len(dialog), domain.db.num_queries - num_queries)
+        recorder.end_dialog(domain=domain.name, turns=len(dialog))
+        if codec is not None:
+            return dialog, one_dialog, delex_dialog
+        return dialog, one_dialog
+
+    def gen_stream(self, domain, complexity, num_sess, json_path, txt_path=None, num_workers=1, seed=None,
+                   delex=False, columnar=False):
+        """
+        Generate synthetic dialogs and write each of them to a JSONL file as soon as it is finished, so the
+        memory stays constant regardless of num_sess.
+
+        :param json_path: the output JSONL file, one dialog per line
+        :param txt_path: the TSV export of the action-level traces. None to skip it.
+        :param num_workers: the number of processes. Each worker writes its own part files which are
+        concatenated in shard order.
+        :param seed: the master seed of the shards, see gen
+        :param delex: True to write the delexicalized turns of each dialog instead, see simdial.delex
+        :param columnar: True to write json_path as a columnar corpus folder instead, see simdial.columnar
+        :return: CorpusStats of the written corpus
+        """
+        if delex and columnar:
+            raise ValueError("A corpus is either delexicalized or columnar")
+
+        if num_workers > 1 or seed is not None:
+            shards = []
+            plan = self.shard_plan(num_sess, num_workers, seed)
+            for shard_id, (n, s) in enumerate(plan):
+                part_txt = None if txt_path is None else "%s.part%d" % (txt_path, shard_id)
+                shards.append((domain, complexity, n, s, "%s.part%d" % (json_path, shard_id), part_txt, delex,
+                               columnar, self._shard_profile(shard_id, len(plan))))
+
+            if len(shards) > 1:
+                results = _map_shards(_write_shard, shards)
+            else:
+                results = [_write_shard(shards[0])]
+
+            (ColumnarWriter if columnar else JsonlWriter).concat([shard[4] for shard in shards], json_path)
+            if txt_path is not None:
+                JsonlWriter.concat([shard[5] for shard in shards], txt_path)
+
+            stats = CorpusStats()
+            for shard_stats, shard_profile in results:
+                stats.merge(shard_stats)
+                if shard_profile is not None:
+                    self.profiler.merge(shard_profile)
+            return stats
+
+        if columnar:
+            writer = ColumnarWriter(json_path, domain, txt_path)
+        elif delex:
+            writer = DelexWriter(json_path, txt_path)
+        else:
+            writer = JsonlWriter(json_path, txt_path)
+        try:
+            prof = self.profiler
+            for record in self.iter_dialogs(domain, complexity, n=num_sess, delex=delex):
+                t = prof.clock()
+                writer.write(*record)
+                prof.lap('write', t)
+        finally:
+            writer.close()
+        return writer.stats
+
+    def gen_checkpointed(self, domain, complexity, num_sess, json_path, checkpoint, txt_path=None, num_workers=1,
+                         delex=False, columnar=False):
+        """
+        Generate the corpus of gen_stream in shards of checkpoint.config['shard_size'] dialogs, seeded from
+        checkpoint.seed. The part files of every shard are kept in the checkpoint folder until all of them
+        are complete, so an interrupted run can be restarted with the same checkpoint and only generates the
+        missing shards. The output does not depend on num_workers or on the interruptions.
+
+        :param checkpoint: a simdial.checkpoint.Checkpoint
+        :return: CorpusStats of the written corpus
+        """
+        if delex and columnar:
+            raise ValueError("A corpus is either delexicalized or columnar")
+        ext = ".cols" if columnar else ".delex.jsonl" if delex else ".jsonl"
+        plan = self.shard_plan(num_sess, -(-num_sess // checkpoint.config['shard_size']), checkpoint.seed)
+
+        todo = []
+        for shard_id, (n, s) in enumerate(plan):
+            if shard_id in checkpoint.done:
+                continue
+            part_txt = None if txt_path is None else checkpoint.part_path(shard_id, ".txt.tmp")
+            todo.append((shard_id, (domain, complexity, n, s, checkpoint.part_path(shard_id, ext + ".tmp"),
+                                    part_txt, delex, columnar, self._shard_profile(shard_id, len(plan)))))
+
+        pool = None
+        if num_workers > 1 and len(todo) > 1:
+            pool = multiprocessing.Pool(min(num_workers, len(todo)), _ignore_sigint)
+        try:
+            if pool is not None:
+                it = pool.imap_unordered(_write_checkpoint_shard, todo)
+                results = (it.next(_POOL_TIMEOUT) for _ in todo)
+            else:
+                results = (_write_checkpoint_shard(args) for args in todo)
+            for shard_id, (shard_stats, shard_profile) in results:
+                _replace(checkpoint.part_path(shard_id, ext + ".tmp"), checkpoint.part_path(shard_id, ext))
+                if txt_path is not None:
+                    _replace(checkpoint.part_path(shard_id, ".txt.tmp"), checkpoint.part_path(shard_id, ".txt"))
+                checkpoint.complete(shard_id, shard_stats)
+                if shard_profile is not None:
+                    self.profiler.merge(shard_profile)
+        except BaseException:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+            raise
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+        # the parts are removed with the checkpoint once the output is complete
+        shard_ids = range(len(plan))
+        (ColumnarWriter if columnar else JsonlWriter).concat([checkpoint.part_path(i, ext) for i in shard_ids],
+                                                             json_path, remove=False)
+        if txt_path is not None:
+            JsonlWriter.concat([checkpoint.part_path(i, ".txt") for i in shard_ids], txt_path, remove=False)
+        stats = CorpusStats()
+        for i in shard_ids:
+            stats.merge(checkpoint.done[i])
+        checkpoint.remove()
+        return stats
+
+    def gen_corpus(self, name, domain_spec, complexity_spec, size, num_workers=1, seed=None, stream=False,
+                   domain_artifact=None, delex=False, columnar=False, profile=False, profile_every=1000,
+                   checkpoint_every=None, append=False):
+        """
+        Generate a corpus and save it in the folder.
+
+        :param name: the output folder
+        :param domain_spec: an implementation of DomainSpec
+        :param complexity_spec: an implementation of ComplexitySpec
+        :param size: the number of dialogs
+        :param num_workers: the number of processes used for generation
+        :param seed: the seed for the database and the dialogs. None keeps the global RNG state.
+        :param stream: True to write one dialog per line in a JSONL file (plus a .meta.json sidecar) while
+        generating, instead of one JSON file at the end.
+        :param domain_artifact: a folder of a compiled domain (see simdial.artifact) to load the domain from.
+        It is compiled there first if it is missing or stale.
+        :param delex: True to write the delexicalized corpus (.delex.jsonl plus a .delex.meta.json sidecar)
+        instead. simdial.delex.DelexReader rebuilds the dialogs from it given the same domain, so pair it with
+        domain_artifact to keep that domain.
+        :param columnar: True to write a columnar corpus folder (.cols) instead, which
+        simdial.columnar.ColumnarReader memory-maps for random access to the dialogs.
+        :param profile: True to time every generation stage and write the report to .profile.json, see
+        simdial.profiler.Profiler
+        :param profile_every: append a snapshot of the report to .profile.jsonl every this many dialogs (per
+        worker, in .profile.jsonl.partN). 0 disables the snapshots.
+        :param checkpoint_every: generate the corpus in shards of this many dialogs and checkpoint every
+        completed shard in a .ckpt folder, see gen_checkpointed. Running the same call again after an
+        interruption resumes it. Without domain_artifact, the domain is saved in a .domain folder next to the
+        corpus, which a delexicalized corpus is rebuilt from. It implies stream if neither delex nor columnar
+        is set. Resuming raises ValueError if the domain artifact is missing or stale.
+        :param append: True to add size dialogs as a new segment of the corpus folder name, see
+        simdial.segments. Every segment shares the domain saved in the folder and draws from its own seed,
+        derived from the seed of the first call. It implies stream if neither delex nor columnar is set.
+        Appending raises ValueError if the domain artifact of the corpus is missing or stale.
+        """
+        if delex and columnar:
+            raise ValueError("A corpus is either delexicalized or columnar")
+
         if not os.path.exists(name):
             os.mkdir(name)
 
-        # create meta specifications
-        domain = Domain(domain_spec)
-        complex = Complexity(complexity_spec)
-
-        # generate the corpus conditioned on domain & complexity
-        corpus, out = self.gen(domain, complex, num_sess=size)
+        if seed is not None:
+            np.random.seed(seed)
 
         # txt_file = "{}-{}-{}.{}".format(domain_spec.name,
         #                                complexity_spec.__name__,
         #                                size, 'txt')
 
-        json_file = "{}-{}-{}.{}".format(domain_spec.name,
-                                         complexity_spec.__name__,
-                                         size, 'json')
-
-        json_file = os.path.join(name, json_file)
-        self.pprint(corpus, True, domain_spec, json_file)
-        self.print_stats(corpus)
-
-        fo = open("out.txt", "w")
-        for all_dialog in out:
-            for one_utt in all_dialog:
-                if "kb_return" in str(one_utt) or "query" in str(one_utt):
-                    continue
-                else:
-                    fo.write(one_utt[0] + "\t" + str(one_utt[1]) + "\t" + one_utt[2] + "\n")
-            fo.write("\n")
-        fo.close()
+        file_stem = "{}-{}-{}".format(domain_spec.name, complexity_spec.__name__, size)
+        file_stem = os.path.join(name, file_stem)
+        meta_stem = file_stem
+        txt_path = "out.txt"
+
+        manifest = None
+        if append:
+            stream = True
+            manifest = CorpusManifest(name, {'artifact': {'version': ARTIFACT_VERSION,
+                                                          'hash': spec_hash(domain_spec)},
+                                             'domain_artifact': domain_artifact,
+                                             'complexity': complexity_spec.__name__,
+                                             'delex': delex,
+                                             'columnar': columnar}, seed)
+            seed = manifest.segment_seed(len(manifest))
+            file_stem = manifest.segment_stem(len(manifest))
+            meta_stem = os.path.join(name, "corpus")
+            txt_path = file_stem + ".txt"
+            if domain_artifact is None:
+                domain_artifact = os.path.join(name, "domain")
+        # the sidecar of an appendable corpus is written once
+        write_meta = manifest is None or len(manifest) == 0
+
+        if profile:
+            for path in glob.glob(file_stem + ".profile.jsonl*"):
+                os.remove(path)
+            self.profiler = Profiler(snapshot_every=profile_every, snapshot_path=file_stem + ".profile.jsonl")
+        prof = self.profiler
+
+        checkpoint = None
+        if checkpoint_every is not None:
+            stream = True
+            checkpoint = Checkpoint(file_stem + ".ckpt", {'domain': spec_hash(domain_spec),
+                                                          'domain_artifact': domain_artifact,
+                                                          'complexity': complexity_spec.__name__,
+                                                          'size': size,
+                                                          'shard_size': checkpoint_every,
+                                                          'delex': delex,
+                                                          'columnar': columnar}, seed)
+            seed = checkpoint.seed
+            # next to the corpus rather than in the checkpoint, which is removed once the corpus is complete
+            if domain_artifact is None:
+                domain_artifact = file_stem + ".domain"
+
+        # create meta specifications
+        t = prof.clock()
+        if domain_artifact is None:
+            domain = Domain(domain_spec)
+        else:
+            # the segments of a corpus and the shards of a checkpoint share its database, so a missing or
+            # stale artifact must not be rebuilt
+            rebuild = (manifest is None or len(manifest) == 0) and (checkpoint is None or len(checkpoint.done) == 0)
+            domain = load_domain(domain_spec, domain_artifact, rebuild=rebuild)
+        complex = Complexity(complexity_spec)
+        prof.lap('domain', t)
+
+        def write_corpus(json_path, **kwargs):
+            if checkpoint is not None:
+                stats = self.gen_checkpointed(domain, complex, size, json_path, checkpoint, txt_path,
+                                              num_workers=num_workers, **kwargs)
+            else:
+                stats = self.gen_stream(domain, complex, size, json_path, txt_path, num_workers=num_workers,
+                                        seed=seed, **kwargs)
+            if manifest is not None:
+                manifest.add(seed, {'corpus': os.path.basename(json_path), 'txt': os.path.basename(txt_path)},
+                             stats)
+            stats.pprint()
+
+        if columnar:
+            if write_meta:
+                JsonlWriter.write_meta(domain_spec, meta_stem + ".meta.json")
+            write_corpus(file_stem + ".cols", columnar=True)
+
+        elif delex:
+            if write_meta:
+                DelexWriter.write_meta(domain_spec, meta_stem + ".delex.meta.json", DelexCodec(domain))
+            write_corpus(file_stem + ".delex.jsonl", delex=True)
+
+        elif stream:
+            if write_meta:
+                JsonlWriter.write_meta(domain_spec, meta_stem + ".meta.json")
+            write_corpus(file_stem + ".jsonl")
+
+        else:
+            # generate the corpus conditioned on domain & complexity
+            corpus, out = self.gen(domain, complex, num_sess=size, num_workers=num_workers, seed=seed)
+
+            t = prof.clock()
+            json_file = file_stem + ".json"
+            self.pprint(corpus, True, domain_spec, json_file)
+            t = prof.lap('pprint', t)
+
+            fo = open("out.txt", "wb")
+            for all_dialog in out:
+                JsonlWriter.write_txt(fo, all_dialog)
+            fo.close()
+            prof.lap('write', t)
+            self.print_stats(corpus)
+
+        if profile:
+            prof.save(file_stem + ".profile.json")
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+# author: Tiancheng Zhao
+from timeit import default_timer
+import logging
+import json
+
+
+class NullProfiler(object):
+    """
+    The default profiler of Generator. It records nothing, so the instrumented loop costs a few no-op calls.
+    """
+
+    enabled = False
+
+    def clock(self):
+        return 0.0
+
+    def lap(self, stage, start):
+        return 0.0
+
+    def end_dialog(self, num_turns, num_queries):
+        pass
+
+
+class Profiler(NullProfiler):
+    """
+    Record the wall time and the number of calls of each generation stage, and the turns and database queries
+    of each dialog. Laps are chained: lap(stage, start) charges the time since start to the stage and returns
+    the start of the next lap.
+
+    :ivar stages: stage name -> [calls, seconds]
+    :ivar num_dialogs: the number of dialogs
+    :ivar num_turns: the number of turns of all dialogs
+    :ivar max_turns: the longest dialog
+    :ivar num_queries: the number of database queries of all dialogs
+    :ivar snapshot_every: emit a snapshot every this many dialogs. 0 disables the snapshots.
+    :ivar snapshot_path: the JSONL file that receives the snapshots. None to log them instead.
+    """
+
+    enabled = True
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, snapshot_every=0, snapshot_path=None):
+        self.stages = {}
+        self.num_dialogs = 0
+        self.num_turns = 0
+        self.max_turns = 0
+        self.num_queries = 0
+        self.snapshot_every = snapshot_every
+        self.snapshot_path = snapshot_path
+        self.start_time = default_timer()
+
+    def clock(self):
+        return default_timer()
+
+    def lap(self, stage, start):
+        now = default_timer()
+        record = self.stages.get(stage)
+        if record is None:
+            record = self.stages[stage] = [0, 0.0]
+        record[0] += 1
+        record[1] += now - start
+        return now
+
+    def end_dialog(self, num_turns, num_queries):
+        """
+        :param num_turns: the number of turns of the finished dialog
+        :param num_queries: the number of database queries made by the dialog
+        """
+        self.num_dialogs += 1
+        self.num_turns += num_turns
+        self.max_turns = max(self.max_turns, num_turns)
+        self.num_queries += num_queries
+        if self.snapshot_every > 0 and self.num_dialogs % self.snapshot_every == 0:
+            self.snapshot()
+
+    def merge(self, other):
+        """
+        Add the records of another profiler, e.g. of a worker process.
+
+        :param other: a Profiler or its to_dict()
+        """
+        if isinstance(other, dict):
+            other = self.from_dict(other)
+        for stage, (calls, sec) in other.stages.items():
+            record = self.stages.setdefault(stage, [0, 0.0])
+            record[0] += calls
+            record[1] += sec
+        self.num_dialogs += other.num_dialogs
+        self.num_turns += other.num_turns
+        self.max_turns = max(self.max_turns, other.max_turns)
+        self.num_queries += other.num_queries
+
+    def to_dict(self):
+        return {'stages': self.stages,
+                'num_dialogs': self.num_dialogs,
+                'num_turns': self.num_turns,
+                'max_turns': self.max_turns,
+                'num_queries': self.num_queries}
+
+    @classmethod
+    def from_dict(cls, data):
+        profiler = cls()
+        profiler.stages = {stage: list(record) for stage, record in data['stages'].items()}
+        profiler.num_dialogs = data['num_dialogs']
+        profiler.num_turns = data['num_turns']
+        profiler.max_turns = data['max_turns']
+        profiler.num_queries = data['num_queries']
+        return profiler
+
+    def report(self):
+        """
+        :return: a JSON-serializable dict of the throughput, the per dialog counters and the per stage timing
+        """
+        elapsed = default_timer() - self.start_time
+        num_dialogs = max(1, self.num_dialogs)
+        staged = sum(sec for _, sec in self.stages.values())
+        return {'elapsed_sec': elapsed,
+                'dialogs': self.num_dialogs,
+                'dialogs_per_sec': self.num_dialogs / elapsed if elapsed > 0 else 0.0,
+                'turns': self.num_turns,
+                'turns_per_dialog': float(self.num_turns) / num_dialogs,
+                'max_turns': self.max_turns,
+                'db_queries': self.num_queries,
+                'db_queries_per_dialog': float(self.num_queries) / num_dialogs,
+                'stages': {stage: {'calls': calls,
+                                   'sec': sec,
+                                   'usec_per_call': 1e6 * sec / calls if calls else 0.0,
+                                   'share': sec / staged if staged > 0 else 0.0}
+                           for stage, (calls, sec) in self.stages.items()}}
+
+    def snapshot(self):
+        """
+        Append the current report to snapshot_path, or log it if there is no snapshot_path.
+        """
+        line = json.dumps(self.report(), sort_keys=True)
+        if self.snapshot_path is None:
+            self.logger.info(line)
+        else:
+            with open(self.snapshot_path, "a") as f:
+                f.write(line + "\n")
+
+    def save(self, path):
+        """
+        Write the final report as a JSON file.
+        """
+        with open(path, "w") as f:
+            json.dump(self.report(), f, indent=2, sort_keys=True)
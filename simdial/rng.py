@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+# author: Tiancheng Zhao
+import numpy as np
+from bisect import bisect_right
+
+
+class RandomPool(object):
+    """
+    A seeded random stream that serves scalar draws from large pre-drawn buffers, so that the many tiny draws
+    of a turn do not pay the dispatch cost of np.random one by one. It follows the np.random API that the
+    simulators use (rand, randint, normal, choice, shuffle), so every component takes either np.random or a
+    RandomPool as its rng.
+
+    The generator reseeds one pool per session with a seed drawn from the global RNG, so every dialog is
+    reproducible from its own seed.
+
+    :ivar buffer_size: the number of uniforms/normals drawn at a time
+    :ivar state: the np.random.RandomState behind the buffers
+    """
+
+    BUFFER_SIZE = 4096
+
+    def __init__(self, seed=None, buffer_size=BUFFER_SIZE):
+        self.buffer_size = buffer_size
+        self.seed(seed)
+
+    def seed(self, seed=None):
+        """
+        Restart the stream from seed and drop the buffered draws.
+        """
+        self.state = np.random.RandomState(seed)
+        self._uniforms = []
+        self._uniform_ptr = 0
+        self._normals = []
+        self._normal_ptr = 0
+
+    def rand(self, *shape):
+        """
+        :return: one uniform float in [0, 1), or an array of the given shape
+        """
+        if shape:
+            return self.state.random_sample(shape)
+        if self._uniform_ptr >= len(self._uniforms):
+            self._uniforms = self.state.random_sample(self.buffer_size).tolist()
+            self._uniform_ptr = 0
+        u = self._uniforms[self._uniform_ptr]
+        self._uniform_ptr += 1
+        return u
+
+    def normal(self, loc=0.0, scale=1.0, size=None):
+        """
+        :return: one Gaussian float, or an array of the given size
+        """
+        if size is not None:
+            return self.state.normal(loc, scale, size=size)
+        if self._normal_ptr >= len(self._normals):
+            self._normals = self.state.standard_normal(self.buffer_size).tolist()
+            self._normal_ptr = 0
+        z = self._normals[self._normal_ptr]
+        self._normal_ptr += 1
+        return loc + scale * z
+
+    def randint(self, low, high=None):
+        """
+        :return: one integer in [low, high), or in [0, low) if high is None
+        """
+        if high is None:
+            low, high = 0, low
+        if high <= low:
+            raise ValueError("low >= high")
+        return low + int(self.rand() * (high - low))
+
+    def choice(self, a, size=None, replace=True, p=None):
+        """
+        :param a: a sequence, or an int for range(a)
+        :param size: None for one element, otherwise the number of elements
+        :param replace: False to draw distinct elements (p is not supported then)
+        :param p: the probabilities of the elements
+        :return: one element of a, or a list of them
+        """
+        population = range(a) if isinstance(a, int) else a
+        num_items = len(population)
+        if num_items == 0:
+            raise ValueError("a must be non-empty")
+
+        if not replace:
+            if p is not None:
+                raise ValueError("p is not supported without replacement")
+            if size > num_items:
+                raise ValueError("Cannot take a larger sample than population when 'replace=False'")
+            # partial Fisher-Yates over the indexes
+            idxes = list(range(num_items))
+            for i in range(size):
+                j = i + int(self.rand() * (num_items - i))
+                idxes[i], idxes[j] = idxes[j], idxes[i]
+            return [population[i] for i in idxes[0:size]]
+
+        if p is not None:
+            cdf = np.cumsum(p).tolist()
+            draw = lambda: population[min(bisect_right(cdf, self.rand() * cdf[-1]), num_items - 1)]
+        else:
+            draw = lambda: population[int(self.rand() * num_items)]
+
+        if size is None:
+            return draw()
+        return [draw() for _ in range(size)]
+
+    def shuffle(self, x):
+        """
+        Shuffle a list in place.
+        """
+        for i in range(len(x) - 1, 0, -1):
+            j = int(self.rand() * (i + 1))
+            x[i], x[j] = x[j], x[i]
+
+
+class RecordingPool(object):
+    """
+    Forward the draws of the NLGs to an rng and record the outcome of every choice and randint, so that a
+    delexicalized corpus can rebuild the same utterances with a ReplayPool. A choice is drawn as the randint of
+    its index, which consumes a RandomPool exactly like RandomPool.choice does.
+
+    :ivar rng: np.random or a RandomPool that draws the outcomes
+    :ivar trace: the recorded outcomes since the last drain
+    """
+
+    def __init__(self, rng):
+        self.rng = rng
+        self.trace = []
+
+    def randint(self, low, high=None):
+        value = self.rng.randint(low, high)
+        self.trace.append(value)
+        return value
+
+    def choice(self, a):
+        idx = self.rng.randint(0, len(a))
+        self.trace.append(idx)
+        return a[idx]
+
+    def drain(self):
+        """
+        :return: the recorded outcomes, and start a new trace
+        """
+        trace, self.trace = self.trace, []
+        return trace
+
+
+class ReplayPool(object):
+    """
+    Return the outcomes recorded by a RecordingPool in the same order.
+
+    :ivar trace: the outcomes to replay
+    """
+
+    def __init__(self, trace=None):
+        self.load(trace or [])
+
+    def load(self, trace):
+        self.trace = trace
+        self._ptr = 0
+
+    def _next(self):
+        if self._ptr >= len(self.trace):
+            raise ValueError("Replay trace is exhausted")
+        value = self.trace[self._ptr]
+        self._ptr += 1
+        return value
+
+    def randint(self, low, high=None):
+        return self._next()
+
+    def choice(self, a):
+        return a[self._next()]
+
+    def is_done(self):
+        """
+        :return: True if every recorded outcome has been replayed
+        """
+        return self._ptr == len(self.trace)
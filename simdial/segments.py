@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+# author: Tiancheng Zhao
+"""
+An appendable corpus folder grows by one segment per gen_corpus(append=True) call. It contains
+
+    manifest.json           the arguments of the corpus, its master seed, and the seed, files, counts and stats
+                            of every segment, plus the totals
+    corpus.meta.json        the domain sidecar, written with the first segment
+    domain/                 the domain artifact, so every segment samples from the same database. The manifest
+                            records its version and spec hash, and a later append fails rather than rebuild it.
+    segment-NNNNNN.*        the corpus and TSV files of each segment
+
+The files of a segment are never rewritten once it is listed in the manifest. A segment that was interrupted
+is not listed, and the next append generates it again from the same seed.
+"""
+from simdial.checkpoint import write_json_atomic
+from simdial.corpus import CorpusStats
+import numpy as np
+import logging
+import json
+import os
+
+SEGMENTS_VERSION = 1
+
+
+class CorpusManifest(object):
+    """
+    The manifest of an appendable corpus folder.
+
+    :ivar path: the corpus folder
+    :ivar config: the arguments shared by all segments, e.g. the spec hash, complexity and format
+    :ivar seed: the master seed of the segment seeds
+    :ivar segments: a list of dict of id, seed, files, num_dialogs and stats of each segment
+    :ivar stats: CorpusStats of all segments
+    """
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, path, config, seed=None):
+        """
+        :param path: the corpus folder
+        :param config: a JSON-serializable dict of the arguments shared by all segments
+        :param seed: the master seed. None to reuse the seed of the manifest, or to draw a new one.
+        :raise ValueError: if the corpus was started with other arguments
+        """
+        self.path = path
+        self.config = json.loads(json.dumps(config))
+        self.segments = []
+        self.stats = CorpusStats()
+        manifest_path = os.path.join(path, "manifest.json")
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                data = json.load(f)
+            if data['version'] != SEGMENTS_VERSION or data['config'] != self.config:
+                raise ValueError("Corpus %s was started with other arguments: %s" % (path, data['config']))
+            if seed is not None and seed != data['seed']:
+                raise ValueError("Corpus %s was started with seed %d" % (path, data['seed']))
+            self.seed = data['seed']
+            self.segments = data['segments']
+            self.stats = CorpusStats.from_dict(data['stats'])
+        else:
+            if not os.path.exists(path):
+                os.makedirs(path)
+            self.seed = int(np.random.randint(0, 2**31-1)) if seed is None else seed
+
+    def __len__(self):
+        return len(self.segments)
+
+    def segment_stem(self, segment_id):
+        return os.path.join(self.path, "segment-%06d" % segment_id)
+
+    def segment_seed(self, segment_id):
+        """
+        :return: the seed of a segment. It only depends on the master seed and the segment id, and differs from
+        the seeds of the previous segments.
+        """
+        used = set(s['seed'] for s in self.segments)
+        state = np.random.RandomState([self.seed, segment_id])
+        seed = int(state.randint(0, 2**31-1))
+        while seed in used:
+            seed = int(state.randint(0, 2**31-1))
+        return seed
+
+    def add(self, seed, files, stats):
+        """
+        Record a complete segment and save the manifest.
+
+        :param seed: the seed of the segment
+        :param files: {'corpus': file name, 'txt': file name} of the segment, relative to the corpus folder
+        :param stats: CorpusStats of the segment
+        """
+        self.segments.append({'id': len(self.segments),
+                              'seed': seed,
+                              'files': files,
+                              'num_dialogs': stats.num_dialogs,
+                              'stats': stats.to_dict()})
+        self.stats.merge(stats)
+        self.save()
+        self.logger.info("Appended %d dialogs to %s" % (stats.num_dialogs, self.path))
+
+    def save(self):
+        write_json_atomic(os.path.join(self.path, "manifest.json"),
+                          {'version': SEGMENTS_VERSION,
+                           'config': self.config,
+                           'seed': self.seed,
+                           'num_dialogs': self.stats.num_dialogs,
+                           'stats': self.stats.to_dict(),
+                           'segments': self.segments})
+
+    def paths(self, kind='corpus'):
+        """
+        :param kind: 'corpus' for the corpus file (or columnar folder) of each segment, 'txt' for its TSV file
+        :return: the paths of the segment files in order
+        """
+        return [os.path.join(self.path, s['files'][kind]) for s in self.segments]
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+# author: Tiancheng Zhao
+"""
+Opt-in logging for simdial. Importing simdial configures nothing. configure_logging sends the records of every
+logger to a file (or stderr in Config.debug) through a queue that a background thread drains, so the simulator
+never waits for log I/O.
+
+The belief updates of the system and the goal changes of the user are not logged line by line. They are
+recorded as structured events by the module-level recorder for 1 in sample_every dialogs, and each sampled
+dialog is logged as one JSON record at the end of the dialog.
+"""
+from simdial.config import Config
+import multiprocessing.util
+import threading
+import logging
+import numpy as np
+import json
+import os
+
+try:
+    from queue import Queue
+except ImportError:
+    from Queue import Queue
+
+FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+
+class QueueHandler(logging.Handler):
+    """
+    Put the records on an unbounded queue and write them with a target handler in a background thread. The
+    records are formatted by the writer thread, so their arguments must not change after they are logged.
+    A forked process, e.g. a generator worker, starts its own writer thread on its first record.
+
+    The queue is thread-safe, so emit does not take the handler lock. A forked process gets new locks,
+    because the writer thread of the parent may have held them at the time of the fork.
+
+    :ivar target: the handler that writes the records
+    """
+
+    def __init__(self, target):
+        logging.Handler.__init__(self)
+        self.target = target
+        self.pid = None
+        self.queue = None
+        self.thread = None
+
+    def _start(self):
+        forked = self.pid is not None
+        self.pid = os.getpid()
+        if forked:
+            self.createLock()
+            self.target.createLock()
+        self.queue = Queue()
+        self.thread = threading.Thread(target=self._write, name="simdial-log-writer")
+        self.thread.daemon = True
+        self.thread.start()
+        if forked:
+            # worker processes skip the atexit hooks, but run the multiprocessing finalizers
+            multiprocessing.util.Finalize(self, self.stop, exitpriority=10)
+
+    def _write(self):
+        while True:
+            record = self.queue.get()
+            if record is None:
+                break
+            self.target.handle(record)
+
+    def handle(self, record):
+        rv = self.filter(record)
+        if rv:
+            self.emit(record)
+        return rv
+
+    def emit(self, record):
+        if self.pid != os.getpid():
+            self._start()
+        self.queue.put(record)
+
+    def stop(self):
+        """
+        Write the queued records and stop the writer thread of this process.
+        """
+        if self.pid == os.getpid() and self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        self.target.flush()
+
+    def close(self):
+        self.stop()
+        self.target.close()
+        logging.Handler.close(self)
+
+
+class _Json(object):
+    """
+    Defer json.dumps of a log argument to the writer thread. NumPy scalars are written as Python numbers, and
+    NaN and infinite numbers as null, which keeps the records standard JSON.
+    """
+
+    def __init__(self, data):
+        self.data = data
+
+    @classmethod
+    def _finite(cls, obj):
+        if isinstance(obj, np.generic):
+            obj = obj.item()
+        if isinstance(obj, float):
+            return obj if np.isfinite(obj) else None
+        if isinstance(obj, dict):
+            return {k: cls._finite(v) for k, v in obj.items()}
+        if isinstance(obj, (list, tuple)):
+            return [cls._finite(v) for v in obj]
+        return obj
+
+    def __str__(self):
+        return json.dumps(self._finite(self.data), sort_keys=True, allow_nan=False)
+
+
+class TraceRecorder(object):
+    """
+    Record the debug events of 1 in sample_every dialogs. The instrumented code checks active before it builds
+    an event, so the dialogs that are not sampled only pay an attribute lookup.
+
+    :ivar sample_every: trace every this many dialogs. 0 disables the tracing.
+    :ivar active: True while a sampled dialog is running
+    :ivar num_dialogs: the number of dialogs started in this process
+    :ivar events: the events of the running dialog, a list of dict
+    """
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, sample_every=0):
+        self.sample_every = sample_every
+        self.active = False
+        self.num_dialogs = 0
+        self.events = []
+
+    def start_dialog(self):
+        self.active = self.sample_every > 0 and self.num_dialogs % self.sample_every == 0
+        self.num_dialogs += 1
+        self.events = []
+
+    def event(self, name, **fields):
+        """
+        :param name: the type of the event
+        :param fields: JSON-serializable fields of the event, or NumPy scalars
+        """
+        fields['event'] = name
+        self.events.append(fields)
+
+    def end_dialog(self, **fields):
+        """
+        Log the events of the dialog if it is sampled.
+
+        :param fields: JSON-serializable fields of the dialog
+        """
+        if self.active:
+            fields.update({'pid': os.getpid(), 'dialog': self.num_dialogs - 1, 'events': self.events})
+            self.logger.debug("%s", _Json(fields))
+        self.active = False
+        self.events = []
+
+
+recorder = TraceRecorder()
+
+
+def configure_logging(filename=None, level=logging.DEBUG, trace_every=None, fmt=FORMAT):
+    """
+    Send the records of every logger to a file through a background QueueHandler. Calling it again replaces
+    the previous configuration.
+
+    :param filename: the log file. None for simdial.log, or stderr if Config.debug is set.
+    :param level: the level of the root logger
+    :param trace_every: log the trace of 1 in trace_every dialogs. None to trace every dialog if Config.debug
+    is set, and none otherwise.
+    :param fmt: the format of the records
+    :return: the QueueHandler
+    """
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler, QueueHandler):
+            root.removeHandler(handler)
+            handler.close()
+
+    if filename is None and not Config.debug:
+        filename = 'simdial.log'
+    target = logging.StreamHandler() if filename is None else logging.FileHandler(filename)
+    target.setFormatter(logging.Formatter(fmt))
+    handler = QueueHandler(target)
+    root.addHandler(handler)
+    root.setLevel(level)
+
+    if trace_every is None:
+        trace_every = 1 if Config.debug else 0
+    recorder.sample_every = trace_every
+    return handler
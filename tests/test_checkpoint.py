@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+A checkpointed run that is stopped after some shards and resumed writes the same bytes as an uninterrupted one.
+
+    python -m unittest discover tests
+"""
+from multiple_domains import RestSpec
+from simdial import complexity
+from simdial.artifact import load_domain
+from simdial.corpus import to_bytes
+from simdial.delex import DelexReader
+import simdial.generator as generator
+import numpy as np
+import unittest
+import tempfile
+import shutil
+import json
+import os
+
+SIZE = 120
+SHARD_SIZE = 30
+NUM_DONE = 2
+
+
+def _stop_after(k):
+    """
+    :return: a _write_checkpoint_shard that raises KeyboardInterrupt instead of writing the (k+1)-th shard
+    """
+    write_shard = generator._write_checkpoint_shard
+    calls = [0]
+
+    def stopping(args):
+        calls[0] += 1
+        if calls[0] > k:
+            raise KeyboardInterrupt("stopped after %d shards" % k)
+        return write_shard(args)
+    return stopping
+
+
+class CheckpointTest(unittest.TestCase):
+
+    def setUp(self):
+        # gen_corpus also writes out.txt in the working directory
+        self.cwd = os.getcwd()
+        self.tmp_dir = tempfile.mkdtemp()
+        os.chdir(self.tmp_dir)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmp_dir)
+
+    def _gen(self, name, **kwargs):
+        folder = os.path.join(self.tmp_dir, name)
+        generator.Generator().gen_corpus(folder, RestSpec(), complexity.MixSpec, SIZE, seed=5,
+                                         checkpoint_every=SHARD_SIZE, **kwargs)
+        return folder
+
+    @staticmethod
+    def _read(folder, ext):
+        with open(os.path.join(folder, "restaurant-MixSpec-%d%s" % (SIZE, ext)), 'rb') as f:
+            return f.read()
+
+    def test_resume(self):
+        serial = self._gen("serial")
+        parallel = self._gen("parallel", num_workers=2)
+
+        write_shard = generator._write_checkpoint_shard
+        generator._write_checkpoint_shard = _stop_after(NUM_DONE)
+        try:
+            self.assertRaises(KeyboardInterrupt, self._gen, "resumed")
+        finally:
+            generator._write_checkpoint_shard = write_shard
+        resumed = os.path.join(self.tmp_dir, "resumed")
+        ckpt_path = os.path.join(resumed, "restaurant-MixSpec-%d.ckpt" % SIZE)
+        with open(os.path.join(ckpt_path, "checkpoint.json")) as f:
+            self.assertEqual(sorted(json.load(f)['done']), [str(i) for i in range(NUM_DONE)])
+
+        # the global RNG state of the restart must not matter
+        np.random.seed(99)
+        self._gen("resumed", num_workers=2)
+        self.assertFalse(os.path.exists(ckpt_path))
+
+        expected = self._read(serial, ".jsonl")
+        self.assertEqual(self._read(parallel, ".jsonl"), expected)
+        self.assertEqual(self._read(resumed, ".jsonl"), expected)
+
+    def test_delex_domain(self):
+        # the domain of the run outlives the checkpoint, so the delexicalized corpus can be rebuilt from it
+        plain = self._gen("plain")
+        delex = self._gen("delex", delex=True)
+        stem = os.path.join(delex, "restaurant-MixSpec-%d" % SIZE)
+        self.assertFalse(os.path.exists(stem + ".ckpt"))
+
+        domain = load_domain(RestSpec(), stem + ".domain", rebuild=False)
+        reader = DelexReader(domain, generator.Generator.pack_msg, stem + ".delex.meta.json")
+        lines = [to_bytes(json.dumps(d, ensure_ascii=False)) + b"\n" for d in reader.read(stem + ".delex.jsonl")]
+        self.assertEqual(b"".join(lines), self._read(plain, ".jsonl"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+A columnar corpus reads back the same dialogs as the JSONL corpus of the same seed.
+
+    python -m unittest discover tests
+"""
+from multiple_domains import RestSpec
+from simdial.generator import Generator
+from simdial.columnar import ColumnarReader, SPEAKERS
+from simdial.complexity import Complexity
+from simdial.domain import Domain
+from simdial import complexity
+import numpy as np
+import unittest
+import tempfile
+import shutil
+import json
+import os
+
+NUM_SESS = 20
+
+
+class ColumnarTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        np.random.seed(0)
+        self.domain = Domain(RestSpec())
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _gen(self, name, **kwargs):
+        path = os.path.join(self.tmp_dir, name)
+        Generator().gen_stream(self.domain, Complexity(complexity.MixSpec), NUM_SESS, path, seed=3, **kwargs)
+        return path
+
+    def test_same_as_jsonl(self):
+        for num_workers in [1, 2]:
+            with open(self._gen("corpus.jsonl", num_workers=num_workers), "rb") as f:
+                expected = [json.loads(line.decode('utf-8')) for line in f]
+            reader = ColumnarReader(self._gen("corpus.cols", columnar=True, num_workers=num_workers))
+            self.assertEqual(len(reader), NUM_SESS)
+            self.assertEqual([reader.dialog(k) for k in range(len(reader))], expected)
+            self.assertEqual(reader.batch([3, 0, 3]), [expected[3], expected[0], expected[3]])
+            self.assertRaises(IndexError, reader.dialog, NUM_SESS)
+
+    def test_arrays(self):
+        reader = ColumnarReader(self._gen("corpus.cols", columnar=True))
+        for k in range(len(reader)):
+            dialog = reader.dialog(k)
+            arrays = reader.arrays(k)
+            self.assertEqual([SPEAKERS[s] for s in arrays['speaker']], [turn['speaker'] for turn in dialog])
+            self.assertEqual(np.diff(arrays['action_offsets']).tolist(), [len(turn['actions']) for turn in dialog])
+            self.assertEqual(len(arrays['act']), arrays['action_offsets'][-1])
+            self.assertEqual(len(arrays['slot']), len(arrays['act']))
+            self.assertEqual(len(arrays['value']), len(arrays['act']))
+            for conf, turn in zip(arrays['conf'], dialog):
+                if 'conf' in turn:
+                    self.assertEqual(conf, turn['conf'])
+                else:
+                    self.assertTrue(np.isnan(conf))
+
+    def test_incomplete(self):
+        path = self._gen("corpus.cols", columnar=True)
+        os.remove(os.path.join(path, "manifest.json"))
+        self.assertRaises(ValueError, ColumnarReader, path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""
+The validation and the draws of the Complexity distributions.
+
+    python -m unittest discover tests
+"""
+from simdial.complexity import Categorical, Complexity, MixSpec
+from simdial.rng import RandomPool
+import numpy as np
+import unittest
+
+
+def _spec(**proposition):
+    """
+    :return: a copy of MixSpec with some proposition entries replaced
+    """
+    spec = dict(MixSpec.proposition)
+    spec.update(proposition)
+    return type('TestSpec', (MixSpec,), {'proposition': spec})
+
+
+class CategoricalTest(unittest.TestCase):
+
+    def test_invalid(self):
+        for dist in [{}, [], None, {1: -0.5, 2: 1.5}, {1: 0.5, 2: 0.4}, {1: 0.7, 2: 0.7},
+                     {1: float('nan'), 2: 1.0}, {1: True}, {1: '1.0'}]:
+            self.assertRaises(ValueError, Categorical, dist)
+        self.assertRaises(ValueError, Categorical, {0: 1.0}, valid_outcomes=lambda o: o > 0)
+
+    def test_zero_probability(self):
+        dist = Categorical({'a': 0.0, 'b': 1.0})
+        self.assertEqual(dist.outcomes, ['b'])
+        self.assertEqual(dist.cdf, [1.0])
+        self.assertEqual(set(dist.draw(np.random.RandomState(0)) for _ in range(20)), {'b'})
+
+    def test_draw(self):
+        # the same draws as choice over the outcomes of the spec dict
+        spec = {'reject': 0.3, 'reject+inform': 0.7}
+        dist = Categorical(spec)
+        rng, choice_rng = RandomPool(3), RandomPool(3)
+        for _ in range(200):
+            self.assertEqual(dist.draw(rng), choice_rng.choice(spec.keys(), p=spec.values()))
+
+
+class ComplexityTest(unittest.TestCase):
+
+    def test_valid(self):
+        complexity = Complexity(MixSpec)
+        self.assertEqual(complexity.multi_goals.to_dict(), MixSpec.proposition['multi_goals'])
+
+    def test_invalid(self):
+        for proposition in [{'multi_goals': {}},
+                            {'multi_goals': {1: -0.2, 2: 1.2}},
+                            {'multi_slots': {1: 0.5, 2: 0.3}},
+                            {'multi_slots': {0: 1.0}},
+                            {'reject_style': {'reject': 0.5, 'ignore': 0.5}},
+                            {'yn_question': 1.5},
+                            {'dont_care': -0.1}]:
+            self.assertRaises(ValueError, Complexity, _spec(**proposition))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+"""
+The packed bitset queries of Database against the set-based select of the original implementation.
+
+    python -m unittest discover tests
+"""
+from multiple_domains import RestSpec
+from simdial.database import Database
+from simdial.domain import Domain
+import numpy as np
+import itertools
+import unittest
+import tempfile
+import shutil
+import pickle
+import os
+
+NUM_ROWS = [1, 7, 8, 9, 100, 1003]
+USR_PRIORS = [[1.0, 1.0], [1.0, 1.0, 1.0], [1.0] * 5]
+SYS_PRIORS = [[1.0, 1.0, 1.0]]
+
+
+def _reference(db, query):
+    """
+    The select of the set-based implementation: a non-zero value of an attribute removes (AND NOT) the rows
+    that have this value, and 0 or None does not constrain the attribute.
+
+    :return: the sorted list of the row ids that satisfy the query
+    """
+    valid_idx = set(range(db.num_rows))
+    for q, a_id in zip(query, range(db.num_usr_slots)):
+        if q:
+            valid_idx -= set(np.flatnonzero(db.table[:, a_id] == q).tolist())
+    return sorted(valid_idx)
+
+
+def _queries():
+    """
+    :return: every query over USR_PRIORS, with None, 0 and each value of every attribute
+    """
+    return [list(q) for q in itertools.product(*[[None] + list(range(len(p))) for p in USR_PRIORS])]
+
+
+class DatabaseTest(unittest.TestCase):
+
+    def _databases(self):
+        for num_rows in NUM_ROWS:
+            for cache_size in [0, 4]:
+                np.random.seed(num_rows)
+                yield Database(USR_PRIORS, SYS_PRIORS, num_rows, cache_size=cache_size)
+
+    def test_select(self):
+        for db in self._databases():
+            for query in _queries():
+                expected = _reference(db, query)
+                # twice to go through the cache
+                for _ in range(2):
+                    entries, valid_idx = db.select(query, return_index=True)
+                    self.assertEqual(list(valid_idx), expected)
+                    self.assertTrue(np.array_equal(entries, db.sys_table[expected, :]))
+
+    def test_count(self):
+        for db in self._databases():
+            for query in _queries():
+                self.assertEqual(db.count(query), len(_reference(db, query)))
+
+    def test_sample_match(self):
+        rng = np.random.RandomState(0)
+        for db in self._databases():
+            for query in _queries():
+                expected = set(_reference(db, query))
+                row_id = db.sample_match(query, rng=rng)
+                if expected:
+                    self.assertIn(row_id, expected)
+                else:
+                    self.assertIsNone(row_id)
+
+    def test_sample_match_reaches_every_row(self):
+        # the rows next to the byte boundaries and the padding bits
+        rng = np.random.RandomState(0)
+        for num_rows in [1, 7, 8, 9, 17]:
+            db = Database(USR_PRIORS, SYS_PRIORS, num_rows)
+            samples = set(db.sample_match([None] * len(USR_PRIORS), rng=rng) for _ in range(50 * num_rows))
+            self.assertEqual(samples, set(range(num_rows)))
+
+    def test_sample_match_cache(self):
+        np.random.seed(100)
+        db_cached = Database(USR_PRIORS, SYS_PRIORS, 100, cache_size=4)
+        query = [1, None, 3]
+        row_id = db_cached.sample_match(query, rng=np.random.RandomState(0))
+        self.assertEqual(db_cached.cache_info()['misses'], 1)
+        self.assertEqual(db_cached.cache_info()['hits'], 0)
+        self.assertEqual(db_cached.sample_match(query, rng=np.random.RandomState(0)), row_id)
+        self.assertEqual(db_cached.count(query), len(_reference(db_cached, query)))
+        self.assertEqual(db_cached.cache_info()['hits'], 2)
+        self.assertEqual(db_cached.cache_info()['size'], 1)
+
+        # the cache does not change the sampled rows
+        np.random.seed(100)
+        db = Database(USR_PRIORS, SYS_PRIORS, 100)
+        rng, cached_rng = np.random.RandomState(1), np.random.RandomState(1)
+        for query in _queries() * 2:
+            self.assertEqual(db.sample_match(query, rng=rng), db_cached.sample_match(query, rng=cached_rng))
+
+    def test_select_many(self):
+        rng = np.random.RandomState(0)
+        for db in self._databases():
+            queries = _queries()
+            references = [_reference(db, q) for q in queries]
+            masks = db.select_many(queries, mode='mask')
+            self.assertEqual(masks.shape, (len(queries), db.num_rows))
+            for mask, expected in zip(masks, references):
+                self.assertEqual(np.flatnonzero(mask).tolist(), expected)
+            self.assertEqual(db.select_many(queries, mode='count').tolist(), [len(r) for r in references])
+            for row_id, expected in zip(db.select_many(queries, mode='sample', rng=rng), references):
+                if expected:
+                    self.assertIn(row_id, expected)
+                else:
+                    self.assertEqual(row_id, -1)
+
+            # DONT_CARE is the same as None and 0
+            dont_care = [[Database.DONT_CARE if v is None else v for v in q] for q in queries]
+            self.assertTrue(np.array_equal(db.select_many(dont_care, mode='mask'), masks))
+
+    def test_padding_bits(self):
+        for db in self._databases():
+            for query in _queries():
+                bits = np.unpackbits(db._query_bits(query))
+                self.assertFalse(bits[db.num_rows:].any())
+
+    def test_nth_bits(self):
+        rng = np.random.RandomState(0)
+        patterns = [[0], [7], [8], [0, 7, 8, 15], list(range(16)), [23], [1, 9, 17, 22]]
+        patterns += [np.flatnonzero(rng.rand(40) < 0.3).tolist() for _ in range(20)]
+        for positions in patterns:
+            bits = np.zeros(40, dtype=np.bool_)
+            bits[positions] = True
+            valid = np.packbits(bits)[None, :]
+            for rank, position in enumerate(positions):
+                self.assertEqual(Database._nth_bits(valid, np.array([rank])).tolist(), [position])
+
+        # several bitsets at once
+        valid = np.packbits(np.eye(16, dtype=np.bool_), axis=1)
+        self.assertEqual(Database._nth_bits(valid, np.zeros(16, dtype=np.int64)).tolist(), list(range(16)))
+
+
+class NoSysSlotSpec(RestSpec):
+    """
+    RestSpec without sys slots, so its database only holds the row ids besides the searchable table
+    """
+    sys_slots = []
+    nlg_spec = {k: v for k, v in RestSpec.nlg_spec.items() if k in ('loc', 'food_pref', 'default')}
+
+
+class SnapshotTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def assertSameDatabase(self, db, expected):
+        self.assertEqual(db.num_rows, expected.num_rows)
+        self.assertEqual(db.usr_modalities, expected.usr_modalities)
+        self.assertEqual(db.sys_modalities, expected.sys_modalities)
+        for name in ('usr_dirichlet_priors', 'sys_dirichlet_priors', 'usr_pdf', 'sys_pdf', 'indexes'):
+            self.assertEqual(len(getattr(db, name)), len(getattr(expected, name)))
+            for a, b in zip(getattr(db, name), getattr(expected, name)):
+                self.assertTrue(np.array_equal(a, b))
+        for name in Database.SNAPSHOT_ARRAYS:
+            self.assertTrue(np.array_equal(getattr(db, name), getattr(expected, name)))
+            self.assertEqual(getattr(db, name).dtype, getattr(expected, name).dtype)
+
+        rng, expected_rng = np.random.RandomState(0), np.random.RandomState(0)
+        for query in _queries():
+            self.assertTrue(np.array_equal(db.select(query), expected.select(query)))
+            self.assertEqual(db.count(query), expected.count(query))
+            self.assertEqual(db.sample_match(query, rng=rng), expected.sample_match(query, rng=expected_rng))
+
+    def test_round_trip(self):
+        for sys_priors in [SYS_PRIORS, []]:
+            np.random.seed(0)
+            db = Database(USR_PRIORS, sys_priors, 100)
+            path = os.path.join(self.tmp_dir, "db%d" % len(sys_priors))
+            db.save(path)
+            for mmap_mode in ['r', None]:
+                loaded = Database.load(path, mmap_mode=mmap_mode, cache_size=4)
+                self.assertSameDatabase(loaded, db)
+                self.assertEqual(isinstance(loaded.table, np.memmap), mmap_mode is not None)
+                self.assertEqual(loaded.cache_size, 4)
+
+    def test_pickle_by_path(self):
+        np.random.seed(0)
+        db = Database(USR_PRIORS, SYS_PRIORS, 1003)
+        path = os.path.join(self.tmp_dir, "db")
+        db.save(path)
+        loaded = Database.load(path)
+
+        # a snapshot is pickled without its arrays, and maps them again when unpickled
+        data = pickle.dumps(loaded, pickle.HIGHEST_PROTOCOL)
+        self.assertLess(len(data), len(pickle.dumps(db, pickle.HIGHEST_PROTOCOL)) // 4)
+        unpickled = pickle.loads(data)
+        self.assertIsInstance(unpickled.table, np.memmap)
+        self.assertSameDatabase(unpickled, db)
+
+        # a database in memory is pickled with its arrays
+        self.assertSameDatabase(pickle.loads(pickle.dumps(db, pickle.HIGHEST_PROTOCOL)), db)
+
+    def test_domain_snapshot(self):
+        for spec in [RestSpec(), NoSysSlotSpec()]:
+            np.random.seed(0)
+            domain = Domain(spec)
+            path = os.path.join(self.tmp_dir, spec.__class__.__name__)
+            domain.db.save(path)
+            self.assertSameDatabase(Domain(spec, db_snapshot=path).db, domain.db)
+
+        self.assertEqual(Domain(NoSysSlotSpec()).db.sys_modalities, [])
+        # the snapshot must match the slots and the size of the domain
+        other_size = type('OtherSizeSpec', (RestSpec,), {'db_size': 50})()
+        self.assertRaises(ValueError, Domain, other_size, db_snapshot=os.path.join(self.tmp_dir, "RestSpec"))
+        self.assertRaises(ValueError, Domain, RestSpec(), db_snapshot=os.path.join(self.tmp_dir, "NoSysSlotSpec"))
+
+
+if __name__ == '__main__':
+    unittest.main()
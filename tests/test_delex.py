@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+A delexicalized corpus re-lexicalizes to the same bytes as the JSONL corpus of the same seed.
+
+    python -m unittest discover tests
+"""
+from multiple_domains import RestSpec
+from simdial.generator import Generator
+from simdial.delex import DelexCodec, DelexReader, DelexWriter
+from simdial.corpus import to_bytes
+from simdial.complexity import Complexity
+from simdial.domain import Domain
+from simdial import complexity
+import numpy as np
+import unittest
+import tempfile
+import shutil
+import json
+import os
+
+NUM_SESS = 20
+
+
+class DelexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        np.random.seed(0)
+        self.domain = Domain(RestSpec())
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _gen(self, name, spec, **kwargs):
+        path = os.path.join(self.tmp_dir, name)
+        Generator().gen_stream(self.domain, Complexity(spec), NUM_SESS, path, seed=3, **kwargs)
+        return path
+
+    def test_round_trip(self):
+        meta_path = os.path.join(self.tmp_dir, "delex.meta.json")
+        DelexWriter.write_meta(RestSpec(), meta_path, DelexCodec(self.domain))
+        reader = DelexReader(self.domain, Generator.pack_msg, meta_path)
+
+        for spec, num_workers in [(complexity.CleanSpec, 1), (complexity.MixSpec, 1), (complexity.MixSpec, 2)]:
+            with open(self._gen("corpus.jsonl", spec, num_workers=num_workers), "rb") as f:
+                expected = f.read()
+            delex_path = self._gen("corpus.delex.jsonl", spec, delex=True, num_workers=num_workers)
+            lines = [to_bytes(json.dumps(d, ensure_ascii=False)) + b"\n" for d in reader.read(delex_path)]
+            self.assertEqual(b"".join(lines), expected)
+
+            # without the system states
+            for d, line in zip(reader.read(delex_path, with_state=False), expected.splitlines()):
+                turns = json.loads(line)
+                for turn in turns:
+                    turn.pop('state', None)
+                self.assertEqual(json.loads(json.dumps(d)), turns)
+
+    def test_other_domain(self):
+        meta_path = os.path.join(self.tmp_dir, "delex.meta.json")
+        DelexWriter.write_meta(RestSpec(), meta_path, DelexCodec(self.domain))
+        other_spec = type('OtherSpec', (RestSpec,), {'usr_slots': RestSpec.usr_slots[:1],
+                                                     'nlg_spec': {k: v for k, v in RestSpec.nlg_spec.items()
+                                                                  if k != 'food_pref'}})()
+        self.assertRaises(ValueError, DelexReader, Domain(other_spec), Generator.pack_msg, meta_path)
+
+
+if __name__ == '__main__':
+    unittest.main()
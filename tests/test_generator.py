@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""
+Seeded and sharded generation with Generator.gen.
+
+    python -m unittest discover tests
+"""
+from multiple_domains import RestSpec
+from simdial.generator import Generator
+from simdial.domain import Domain
+from simdial.complexity import Complexity
+from simdial import complexity
+import numpy as np
+import unittest
+
+NUM_SESS = 13
+
+
+class GeneratorTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        np.random.seed(0)
+        cls.domain = Domain(RestSpec())
+        cls.complexity = Complexity(complexity.MixSpec)
+
+    def _gen(self, **kwargs):
+        return Generator().gen(self.domain, self.complexity, num_sess=NUM_SESS, **kwargs)
+
+    def test_deterministic(self):
+        for num_workers in [1, 2, 3]:
+            dialogs, outputs = self._gen(num_workers=num_workers, seed=7)
+            self.assertEqual(len(dialogs), NUM_SESS)
+            self.assertEqual(len(outputs), NUM_SESS)
+            # the global RNG state does not matter
+            np.random.seed(num_workers)
+            self.assertEqual(self._gen(num_workers=num_workers, seed=7), (dialogs, outputs))
+
+    def test_merge_shards(self):
+        # the shards are concatenated in shard order, each one generated from its own seed
+        for num_workers in [1, 3]:
+            dialogs, outputs = [], []
+            for num_sess, seed in Generator.shard_plan(NUM_SESS, num_workers, 7):
+                np.random.seed(seed)
+                shard_dialogs, shard_outputs = Generator().gen(self.domain, self.complexity, num_sess=num_sess)
+                dialogs.extend(shard_dialogs)
+                outputs.extend(shard_outputs)
+            self.assertEqual(self._gen(num_workers=num_workers, seed=7), (dialogs, outputs))
+
+    def test_shard_plan(self):
+        plan = Generator.shard_plan(NUM_SESS, 4, 7)
+        self.assertEqual([n for n, s in plan], [4, 3, 3, 3])
+        self.assertEqual(len(set(s for n, s in plan)), 4)
+        self.assertEqual(plan, Generator.shard_plan(NUM_SESS, 4, 7))
+        self.assertEqual(len(Generator.shard_plan(2, 4, 7)), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
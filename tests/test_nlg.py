@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+"""
+The fragment caches of the NLGs.
+
+    python -m unittest discover tests
+"""
+from multiple_domains import RestSpec
+from simdial.agent.nlg import SysNlg
+from simdial.agent.core import Action, SystemAct
+from simdial.complexity import Complexity, MixSpec
+from simdial.domain import Domain
+import numpy as np
+import unittest
+
+
+class SysNlgTest(unittest.TestCase):
+
+    def test_query_cache(self):
+        np.random.seed(0)
+        domain = Domain(RestSpec())
+        nlg = SysNlg(domain, Complexity(MixSpec))
+        usr_slot, sys_slot = domain.usr_slots[0].name, domain.sys_slots[0].name
+        query = Action(SystemAct.QUERY, [[(usr_slot, 1)], [sys_slot]])
+
+        utt, (lex_action,) = nlg.generate_sent([query])
+        cached_utt, (cached_action,) = nlg.generate_sent([query])
+        self.assertEqual(cached_utt, utt)
+        self.assertEqual(cached_action, lex_action)
+
+        # the lexicalized actions do not share the cached dict
+        self.assertIsNot(cached_action.parameters[0], lex_action.parameters[0])
+        lex_action.parameters[0][usr_slot] = 'changed'
+        self.assertEqual(nlg.generate_sent([query])[1][0].parameters[0],
+                         {usr_slot: domain.usr_slots[0].vocabulary[1]})
+
+
+if __name__ == '__main__':
+    unittest.main()
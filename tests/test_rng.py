@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+The random pools: seeded draws, recording and replaying the NLG choices, and per-session reseeding.
+
+    python -m unittest discover tests
+"""
+from multiple_domains import RestSpec
+from simdial.rng import RandomPool, RecordingPool, ReplayPool
+from simdial.generator import Generator
+from simdial.complexity import Complexity
+from simdial.delex import DelexReader
+from simdial.domain import Domain
+from simdial import complexity
+import numpy as np
+import unittest
+
+
+def _draws(rng):
+    """
+    :return: a mix of the draws the simulators make
+    """
+    items = list(range(10))
+    rng.shuffle(items)
+    return [rng.rand(), rng.normal(1.0, 2.0), rng.randint(3, 9), rng.choice(['a', 'b', 'c']),
+            rng.choice(4, p=[0.1, 0.2, 0.3, 0.4]), rng.choice(6, size=3, replace=False), items]
+
+
+class RandomPoolTest(unittest.TestCase):
+
+    def test_seeded(self):
+        rng = RandomPool(3)
+        draws = [_draws(rng) for _ in range(50)]
+        other = RandomPool(3)
+        self.assertEqual([_draws(other) for _ in range(50)], draws)
+
+        # reseeding restarts the stream and drops the buffered draws
+        rng.seed(3)
+        self.assertEqual([_draws(rng) for _ in range(50)], draws)
+        rng.seed(4)
+        self.assertNotEqual([_draws(rng) for _ in range(50)], draws)
+
+    def test_draws(self):
+        rng = RandomPool(0)
+        for _ in range(200):
+            self.assertTrue(0 <= rng.rand() < 1)
+            self.assertTrue(3 <= rng.randint(3, 5) < 5)
+            self.assertTrue(0 <= rng.randint(2) < 2)
+            self.assertEqual(len(set(rng.choice(5, size=5, replace=False))), 5)
+            self.assertEqual(rng.choice(['a', 'b'], p=[0.0, 1.0]), 'b')
+        self.assertEqual(rng.rand(2, 3).shape, (2, 3))
+        self.assertRaises(ValueError, rng.randint, 3, 3)
+        self.assertRaises(ValueError, rng.choice, [])
+        self.assertRaises(ValueError, rng.choice, 3, size=4, replace=False)
+
+    def test_record_replay(self):
+        items = ['a', 'b', 'c', 'd']
+        recorder = RecordingPool(RandomPool(5))
+        drawn = [(recorder.choice(items), recorder.randint(0, 10)) for _ in range(20)]
+        trace = recorder.drain()
+        self.assertEqual(len(trace), 40)
+        self.assertEqual(recorder.trace, [])
+
+        # a choice consumes the pool like RandomPool.choice does
+        rng = RandomPool(5)
+        self.assertEqual(drawn, [(rng.choice(items), rng.randint(0, 10)) for _ in range(20)])
+
+        replay = ReplayPool(trace)
+        self.assertEqual([(replay.choice(items), replay.randint(0, 10)) for _ in range(20)], drawn)
+        self.assertTrue(replay.is_done())
+        self.assertRaises(ValueError, replay.randint, 0, 10)
+
+
+class SessionSeedTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        np.random.seed(0)
+        cls.domain = Domain(RestSpec())
+        cls.complexity = Complexity(complexity.MixSpec)
+
+    def test_reseed(self):
+        # every session is reseeded from the global RNG, so dialog k only depends on its own seed
+        np.random.seed(11)
+        dialogs = [d for d, _ in Generator().iter_dialogs(self.domain, self.complexity, n=5)]
+        for k in range(1, 5):
+            # skip the seeds of the first k sessions, without running them
+            np.random.seed(11)
+            for _ in range(k):
+                np.random.randint(0, 2**31-1)
+            self.assertEqual([d for d, _ in Generator().iter_dialogs(self.domain, self.complexity, n=5-k)],
+                             dialogs[k:])
+
+    def test_replay_session(self):
+        # replaying the recorded choices of a session reproduces the same dialog
+        np.random.seed(11)
+        reader = DelexReader(self.domain, Generator.pack_msg)
+        for dialog, _, delex_dialog in Generator().iter_dialogs(self.domain, self.complexity, n=5, delex=True):
+            self.assertEqual(reader.rebuild(delex_dialog), dialog)
+
+
+if __name__ == '__main__':
+    unittest.main()
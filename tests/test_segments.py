@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+Appending segments to a corpus folder with gen_corpus(append=True).
+
+    python -m unittest discover tests
+"""
+from multiple_domains import RestSpec
+from simdial import complexity
+from simdial.segments import CorpusManifest
+import simdial.generator as generator
+import unittest
+import tempfile
+import shutil
+import json
+import os
+
+SIZE = 15
+
+
+class SegmentsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.folder = os.path.join(self.tmp_dir, "corpus")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _append(self, complexity_spec=complexity.MixSpec, **kwargs):
+        generator.Generator().gen_corpus(self.folder, RestSpec(), complexity_spec, SIZE, append=True, **kwargs)
+
+    def _manifest(self):
+        with open(os.path.join(self.folder, "manifest.json")) as f:
+            return json.load(f)
+
+    def _read_files(self):
+        files = {}
+        for name in os.listdir(self.folder):
+            if name.startswith("segment-"):
+                with open(os.path.join(self.folder, name), 'rb') as f:
+                    files[name] = f.read()
+        return files
+
+    def test_append(self):
+        self._append(seed=5)
+        self._append()
+        before = self._read_files()
+        self.assertEqual(sorted(before), ["segment-000000.jsonl", "segment-000000.txt",
+                                          "segment-000001.jsonl", "segment-000001.txt"])
+
+        self._append()
+        after = self._read_files()
+        for name, data in before.items():
+            self.assertEqual(after[name], data)
+
+        manifest = self._manifest()
+        self.assertEqual(manifest['seed'], 5)
+        self.assertEqual(manifest['num_dialogs'], 3 * SIZE)
+        self.assertEqual([s['num_dialogs'] for s in manifest['segments']], [SIZE] * 3)
+        seeds = [s['seed'] for s in manifest['segments']]
+        self.assertEqual(len(set(seeds)), 3)
+        self.assertNotEqual(after["segment-000000.jsonl"], after["segment-000001.jsonl"])
+        self.assertNotEqual(after["segment-000001.jsonl"], after["segment-000002.jsonl"])
+
+    def test_mismatch(self):
+        self._append(seed=5)
+        self.assertRaises(ValueError, self._append, complexity.CleanSpec)
+        self.assertRaises(ValueError, self._append, delex=True)
+        self.assertRaises(ValueError, self._append, seed=6)
+        # the failed calls did not add a segment
+        self.assertEqual(len(self._manifest()['segments']), 1)
+
+        config = self._manifest()['config']
+        self.assertRaises(ValueError, CorpusManifest, self.folder, dict(config, complexity='CleanSpec'))
+        self.assertRaises(ValueError, CorpusManifest, self.folder, config, seed=6)
+        self.assertEqual(CorpusManifest(self.folder, config, seed=5).seed, 5)
+
+    def test_missing_domain(self):
+        # a later segment must not sample from a rebuilt database
+        self._append(seed=5)
+        shutil.rmtree(os.path.join(self.folder, "domain"))
+        self.assertRaises(ValueError, self._append)
+
+
+if __name__ == '__main__':
+    unittest.main()
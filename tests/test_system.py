@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+"""
+The belief slots of the system.
+
+    python -m unittest discover tests
+"""
+from simdial.agent.system import BeliefSlot
+import unittest
+
+
+class BeliefSlotTest(unittest.TestCase):
+
+    def test_grounding(self):
+        slot = BeliefSlot('#loc', ['a', 'b', 'c'])
+        # grounding an empty slot does nothing
+        slot.add_grounding(1.0, 0.0, 0)
+        self.assertEqual(slot.max_conf(), 0.0)
+
+        slot.add_new_observation(1, 0.5, 1)
+        slot.add_grounding(1.0, 0.0, 2, target_value=1)
+        self.assertEqual(slot.get_maxconf_value(), 1)
+        self.assertAlmostEqual(slot.max_conf(), 1.3)
+        slot.add_grounding(0.0, 1.0, 3)
+        self.assertAlmostEqual(slot.max_conf(), 0.5)
+
+        # a value that was never observed cannot be grounded
+        self.assertRaises(KeyError, slot.add_grounding, 1.0, 0.0, 4, target_value=2)
+        self.assertAlmostEqual(slot.max_conf(), 0.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
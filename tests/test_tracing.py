@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+"""
+The JSON records of the sampled dialog traces.
+
+    python -m unittest discover tests
+"""
+from simdial.tracing import _Json
+import numpy as np
+import unittest
+import json
+
+
+class JsonTest(unittest.TestCase):
+
+    def test_standard_json(self):
+        data = {'event': 'ground', 'old_conf': -np.inf, 'new_conf': np.float64(0.5), 'turn': np.int64(3),
+                'events': [{'conf': float('nan')}, (np.float32(np.inf), 1)]}
+        self.assertEqual(json.loads(str(_Json(data))),
+                         {'event': 'ground', 'old_conf': None, 'new_conf': 0.5, 'turn': 3,
+                          'events': [{'conf': None}, [None, 1]]})
+
+
+if __name__ == '__main__':
+    unittest.main()